@@ -1,7 +1,5 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
-import sys
-import traceback
 from datetime import datetime
 
 from botbuilder.core import (
@@ -11,6 +9,13 @@ from botbuilder.core import (
     TurnContext,
 )
 from botbuilder.schema import ActivityTypes, Activity
+from botframework.connector.aio import ConnectorClient
+from botframework.connector.auth import AppCredentials
+
+from helpers import LogHelper, SharedHttpSession, TurnMetrics
+from storage import ETagConflictError
+
+LOGGER = LogHelper.get_logger("adapter")
 
 
 class AdapterWithErrorHandler(BotFrameworkAdapter):
@@ -18,17 +23,18 @@ class AdapterWithErrorHandler(BotFrameworkAdapter):
         self,
         settings: BotFrameworkAdapterSettings,
         conversation_state: ConversationState,
+        http_session: SharedHttpSession = None,
     ):
         super().__init__(settings)
         self._conversation_state = conversation_state
+        self._http_session = http_session
 
         # Catch-all for errors.
         async def on_error(context: TurnContext, error: Exception):
-            # This check writes out errors to console log
+            # This check writes out errors to the log
             # NOTE: In production environment, you should consider logging this to Azure
             #       application insights.
-            print(f"\n [on_turn_error] unhandled error: {error}", file=sys.stderr)
-            traceback.print_exc()
+            LOGGER.error("[on_turn_error] unhandled error: %s", error, exc_info=error)
 
             # Send a message to the user
             await context.send_activity("The bot encountered an error or bug.")
@@ -49,8 +55,26 @@ class AdapterWithErrorHandler(BotFrameworkAdapter):
                 # Send a trace activity, which will be displayed in Bot Framework Emulator
                 await context.send_activity(trace_activity)
 
+            # Another turn changed the state since it was read: it is kept.
+            if isinstance(error, ETagConflictError):
+                return
+
             # Clear out state
             nonlocal self
             await self._conversation_state.delete(context)
 
         self.on_turn_error = on_error
+
+    def _get_or_create_connector_client(
+        self, service_url: str, credentials: AppCredentials
+    ) -> ConnectorClient:
+        # The connector clients are cached per service url; they all send their
+        # requests on the shared session.
+        client = super()._get_or_create_connector_client(service_url, credentials)
+        if self._http_session is not None:
+            self._http_session.attach(client.config)
+        return client
+
+    async def send_activities(self, context: TurnContext, activities):
+        with TurnMetrics.span("adapter.send_activities"):
+            return await super().send_activities(context, activities)
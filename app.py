@@ -9,6 +9,7 @@ This sample shows how to create a bot that demonstrates the following:
 - Prompt for and validate requests for information from the user.
 """
 
+import socket
 from http import HTTPStatus
 
 from aiohttp import web
@@ -19,93 +20,275 @@ from botbuilder.core import (
     MemoryStorage,
     UserState,
 )
-
-from botbuilder.azure import CosmosDbConfig, CosmosDbStorage
 from botbuilder.core.integration import aiohttp_error_middleware
-from botbuilder.schema import Activity
-from botbuilder.applicationinsights import ApplicationInsightsTelemetryClient
-from botbuilder.integration.applicationinsights.aiohttp import (
-    AiohttpTelemetryProcessor,
-    bot_telemetry_middleware,
-)
+from applicationinsights.channel import SynchronousSender, TelemetryChannel
 
 from config import DefaultConfig
+from helpers import (
+    ActivityParser,
+    AdmissionControl,
+    BufferedTelemetryQueue,
+    CardRegistry,
+    ConversationLocks,
+    DialogRuntime,
+    FileTelemetrySender,
+    LazyRecognizer,
+    LazyTelemetryClient,
+    LogHelper,
+    SharedHttpSession,
+    StateWriteCoordinator,
+    TranscriptExporter,
+    TurnMetrics,
+    WorkerSupervisor,
+)
 from dialogs import MainDialog, BookingDialog
 from bots import DialogAndWelcomeBot
 
 from adapter_with_error_handler import AdapterWithErrorHandler
 from flight_booking_recognizer import FlightBookingRecognizer
+from local_flight_booking_recognizer import LocalFlightBookingRecognizer
 from middleware1 import Middleware1, Middleware2
+from storage import CachedStorage, ConversationLeases, LazyStorage, SqliteStorage, TimedStorage
 
 CONFIG = DefaultConfig()
+LogHelper.configure(CONFIG.LOG_LEVEL, CONFIG.LOG_SAMPLING)
+TurnMetrics.configure(CONFIG.METRICS_ENABLED)
+
+# Create the storage, UserState and ConversationState
+STORAGE_CACHE = None
+SQLITE_STORAGE = None
+if CONFIG.STORAGE_BACKEND == "sqlite":
+    STORAGE = SQLITE_STORAGE = SqliteStorage(CONFIG.STORAGE_PATH)
+    # Hot conversations are read from memory, every change is still persisted.
+    # SO_REUSEPORT spreads the connections, not the conversations, over the
+    # workers, so the cache is only safe with a single worker.
+    if CONFIG.STORAGE_CACHE_SIZE > 0 and CONFIG.WORKERS == 1:
+        STORAGE = STORAGE_CACHE = CachedStorage(STORAGE, CONFIG.STORAGE_CACHE_SIZE)
+else:
+    STORAGE = MemoryStorage()
+if CONFIG.METRICS_ENABLED:
+    STORAGE = TimedStorage(STORAGE)
+USER_STATE = UserState(STORAGE)
+CONVERSATION_STATE = ConversationState(STORAGE)
 
-# Create MemoryStorage, UserState and ConversationState
-MEMORY = MemoryStorage()
-USER_STATE = UserState(MEMORY)
-CONVERSATION_STATE = ConversationState(MEMORY)
+# The optional subsystems are built on their first use or when the application
+# starts, not when this module is imported: their modules are slow to import and
+# the Cosmos DB client connects to its account when it is created.
+def create_cosmos_db_storage():
+    # pylint: disable=import-outside-toplevel
+    from botbuilder.azure import CosmosDbConfig, CosmosDbStorage
 
-COMOS_DB_CONFIG = CosmosDbConfig(
-    CONFIG.DB_ENDPOINT,CONFIG.DB_KEY,
-    CONFIG.DB_NAME, CONFIG.DB_CONTAINER_NAME)
-COSMOS_DB_STORAGE = CosmosDbStorage(COMOS_DB_CONFIG)
+    cosmos_db_config = CosmosDbConfig(
+        CONFIG.DB_ENDPOINT,CONFIG.DB_KEY,
+        CONFIG.DB_NAME, CONFIG.DB_CONTAINER_NAME)
+    return CosmosDbStorage(cosmos_db_config)
+
+# Built by the exporter's thread, with the first failed conversation.
+COSMOS_DB_STORAGE = LazyStorage(create_cosmos_db_storage, "cosmos")
+# Failed conversations are batched and written by a background task.
+TRANSCRIPT_EXPORTER = TranscriptExporter(
+    COSMOS_DB_STORAGE,
+    batch_size=CONFIG.EXPORT_BATCH_SIZE,
+    flush_interval=CONFIG.EXPORT_FLUSH_INTERVAL,
+    max_retries=CONFIG.EXPORT_MAX_RETRIES,
+    spill_path=CONFIG.EXPORT_SPILL_PATH,
+)
 
 
 # Create telemetry client.
-# Note the small 'client_queue_size'.  This is for demonstration purposes.  Larger queue sizes
-# result in fewer calls to ApplicationInsights, improving bot performance at the expense of
-# less frequent updates.
+# The telemetry is buffered and sent in batches by a background thread, the turns
+# never wait for Application Insights.
 INSTRUMENTATION_KEY = CONFIG.APPINSIGHTS_INSTRUMENTATION_KEY
-TELEMETRY_CLIENT = ApplicationInsightsTelemetryClient(
-    INSTRUMENTATION_KEY, telemetry_processor=AiohttpTelemetryProcessor(), client_queue_size=10
+if CONFIG.TELEMETRY_SINK == "appinsights":
+    TELEMETRY_SENDER = SynchronousSender()
+else:
+    TELEMETRY_SENDER = FileTelemetrySender(
+        "-" if CONFIG.TELEMETRY_SINK == "stdout" else CONFIG.TELEMETRY_FILE
+    )
+TELEMETRY_QUEUE = BufferedTelemetryQueue(
+    TELEMETRY_SENDER,
+    batch_size=CONFIG.TELEMETRY_BATCH_SIZE,
+    flush_interval=CONFIG.TELEMETRY_FLUSH_INTERVAL,
+    max_buffer=CONFIG.TELEMETRY_MAX_BUFFER,
+    sampling=LogHelper.parse_sampling(CONFIG.TELEMETRY_SAMPLING),
 )
+TELEMETRY_CHANNEL = TelemetryChannel(queue=TELEMETRY_QUEUE)
+
+def create_telemetry_client():
+    # pylint: disable=import-outside-toplevel
+    from applicationinsights import TelemetryClient
+    from botbuilder.applicationinsights import ApplicationInsightsTelemetryClient
+    from botbuilder.integration.applicationinsights.aiohttp import AiohttpTelemetryProcessor
+
+    return ApplicationInsightsTelemetryClient(
+        INSTRUMENTATION_KEY,
+        # Without an instrumentation key, e.g. with a local sink, the client is built on the channel alone.
+        telemetry_client=TelemetryClient(INSTRUMENTATION_KEY or TELEMETRY_CHANNEL, TELEMETRY_CHANNEL),
+        telemetry_processor=AiohttpTelemetryProcessor(),
+    )
+
+TELEMETRY_CLIENT = LazyTelemetryClient(create_telemetry_client, "telemetry")
 
 # Create adapter.
 # See https://aka.ms/about-bot-adapter to learn more about how bots work.
 SETTINGS = BotFrameworkAdapterSettings(CONFIG.APP_ID, CONFIG.APP_PASSWORD)
 SETTINGS = BotFrameworkAdapterSettings(None, None)
-ADAPTER = AdapterWithErrorHandler(SETTINGS, CONVERSATION_STATE)
-luis_recognizer = FlightBookingRecognizer(CONFIG, TELEMETRY_CLIENT)
+# One pool of keep-alive connections for the LUIS and Bot Connector calls.
+HTTP_SESSION = SharedHttpSession(CONFIG.HTTP_POOL_SIZE, CONFIG.HTTP_POOL_BLOCK)
+ADAPTER = AdapterWithErrorHandler(SETTINGS, CONVERSATION_STATE, http_session=HTTP_SESSION)
 
-ADAPTER.use(Middleware1(luis_recognizer))
-ADAPTER.use(Middleware2(CONVERSATION_STATE, COSMOS_DB_STORAGE))
+# A single recognizer is shared by the middleware and the dialogs so that
+# each message is sent to LUIS only once per turn.
+# The local recognizer also serves the turns for which LUIS exceeds its latency budget.
+# Both are built, and the local one trained, when the application starts.
+LOCAL_RECOGNIZER = LazyRecognizer(lambda: LocalFlightBookingRecognizer(CONFIG), "local recognizer")
+if CONFIG.RECOGNIZER_BACKEND == "local":
+    RECOGNIZER = LOCAL_RECOGNIZER
+else:
+    RECOGNIZER = LazyRecognizer(
+        lambda: FlightBookingRecognizer(
+            CONFIG,
+            telemetry_client=TELEMETRY_CLIENT,
+            fallback_recognizer=LOCAL_RECOGNIZER,
+            http_session=HTTP_SESSION,
+        ),
+        "recognizer",
+    )
+
+# Outermost middleware: saves the conversation and user states with one write per turn.
+STATE_WRITE_COORDINATOR = StateWriteCoordinator(STORAGE, [CONVERSATION_STATE, USER_STATE])
+ADAPTER.use(STATE_WRITE_COORDINATOR)
+ADAPTER.use(Middleware1(RECOGNIZER))
+ADAPTER.use(
+    Middleware2(CONVERSATION_STATE, TRANSCRIPT_EXPORTER, CONFIG.TRANSCRIPT_MAX_ENTRIES)
+)
 
 # Create dialogs and Bot
-RECOGNIZER = FlightBookingRecognizer(CONFIG, telemetry_client=TELEMETRY_CLIENT)
 BOOKING_DIALOG = BookingDialog(
     user_state=USER_STATE,
     con_state=CONVERSATION_STATE,
     telemetry_client=TELEMETRY_CLIENT
     )
 DIALOG = MainDialog(RECOGNIZER, BOOKING_DIALOG, telemetry_client=TELEMETRY_CLIENT)
-BOT = DialogAndWelcomeBot(CONVERSATION_STATE, USER_STATE, DIALOG, telemetry_client=TELEMETRY_CLIENT)
+# The dialog set is built once and shared by every turn.
+DIALOG_RUNTIME = DialogRuntime(DIALOG, CONVERSATION_STATE)
+# Cards are read from disk once, not for every member added to a conversation.
+CARD_REGISTRY = CardRegistry(reload_interval=CONFIG.CARDS_RELOAD_INTERVAL)
+CARD_REGISTRY.preload()
+BOT = DialogAndWelcomeBot(
+    CONVERSATION_STATE,
+    USER_STATE,
+    DIALOG,
+    telemetry_client=TELEMETRY_CLIENT,
+    dialog_runtime=DIALOG_RUNTIME,
+    card_registry=CARD_REGISTRY,
+)
+
+# Sheds the requests past the in-flight limit and its wait queue.
+ADMISSION_CONTROL = AdmissionControl(
+    CONFIG.MAX_IN_FLIGHT, CONFIG.MAX_QUEUE, CONFIG.QUEUE_TIMEOUT, CONFIG.RETRY_AFTER
+)
+# Orders the turns of each conversation, the conversations run concurrently.
+# The workers sharing the sqlite storage order them with its leases.
+CONVERSATION_LEASES = None
+if CONFIG.WORKERS > 1 and SQLITE_STORAGE is not None:
+    CONVERSATION_LEASES = ConversationLeases(SQLITE_STORAGE, CONFIG.CONVERSATION_LEASE_TTL)
+CONVERSATION_LOCKS = ConversationLocks(CONVERSATION_LEASES)
+
+# Stage durations and component statistics served on /metrics.
+if CONFIG.METRICS_ENABLED:
+    TurnMetrics.instrument(DIALOG)
+    TurnMetrics.register("admission", ADMISSION_CONTROL.stats)
+    TurnMetrics.register("conversation_locks", CONVERSATION_LOCKS.stats)
+    TurnMetrics.register("export", TRANSCRIPT_EXPORTER.stats)
+    TurnMetrics.register("http", HTTP_SESSION.stats)
+    TurnMetrics.register("telemetry", TELEMETRY_QUEUE.stats)
+    TurnMetrics.register("state", lambda: {"writes": STATE_WRITE_COORDINATOR.writes})
+    if STORAGE_CACHE is not None:
+        TurnMetrics.register("storage_cache", STORAGE_CACHE.stats)
+    if RECOGNIZER is not LOCAL_RECOGNIZER:
+        TurnMetrics.register("recognizer", lambda: RECOGNIZER.stats() if RECOGNIZER.built else {})
 
 # Listen for incoming requests on /api/messages.
 async def messages(req: Request) -> Response:
     # Main bot message handler.
-    if "application/json" in req.headers["Content-Type"]:
-        body = await req.json()
-    else:
+    if "application/json" not in req.headers.get("Content-Type", ""):
         return Response(status=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+    # Rejected before reading the body when the client announces its size.
+    if req.content_length is not None and req.content_length > CONFIG.MAX_BODY_SIZE:
+        return Response(status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
 
-    activity = Activity().deserialize(body)
+    try:
+        activity = ActivityParser.parse(ActivityParser.loads(await req.read()))
+    except ValueError:
+        return Response(status=HTTPStatus.BAD_REQUEST)
     auth_header = req.headers["Authorization"] if "Authorization" in req.headers else ""
+    conversation_id = activity.conversation.id if activity.conversation else None
 
-    try:
-        response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
+    async def turn() -> Response:
+        with TurnMetrics.span("turn"):
+            response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
         if response:
             return json_response(data=response.body, status=response.status)
         return Response(status=HTTPStatus.OK)
+
+    try:
+        # The turns of a conversation run one after the other, in arrival order.
+        # A turn is only admitted once the previous ones are done, so that the
+        # turns waiting for their conversation hold no in-flight slot.
+        async with CONVERSATION_LOCKS.hold(conversation_id):
+            if CONFIG.MAX_IN_FLIGHT > 0:
+                return await ADMISSION_CONTROL.run(turn)
+            return await turn()
     except Exception as exception:
         raise exception
 
 def init_func(argv):
-    app_ = web.Application(middlewares=[bot_telemetry_middleware, aiohttp_error_middleware])
+    # pylint: disable=import-outside-toplevel
+    from botbuilder.integration.applicationinsights.aiohttp import bot_telemetry_middleware
+
+    app_ = web.Application(
+        middlewares=[bot_telemetry_middleware, aiohttp_error_middleware],
+        client_max_size=CONFIG.MAX_BODY_SIZE,
+    )
     app_.router.add_post("/api/messages", messages)
+    if CONFIG.METRICS_ENABLED:
+        # Not admission controlled: scraped even when turns are shed.
+        app_.router.add_get(CONFIG.METRICS_PATH, TurnMetrics.handler)
+    app_.on_startup.append(LOCAL_RECOGNIZER.on_startup)
+    app_.on_startup.append(RECOGNIZER.on_startup)
+    app_.on_startup.append(TELEMETRY_CLIENT.on_startup)
+    app_.on_startup.append(TRANSCRIPT_EXPORTER.on_startup)
+    app_.on_cleanup.append(TRANSCRIPT_EXPORTER.on_cleanup)
+    app_.on_cleanup.append(HTTP_SESSION.on_cleanup)
+    app_.on_cleanup.append(TELEMETRY_QUEUE.on_cleanup)
+    if SQLITE_STORAGE is not None:
+        app_.on_cleanup.append(SQLITE_STORAGE.on_cleanup)
     return app_
 
+def run_worker(worker_id: int):
+    # Each worker runs in its own process, with the objects built when it
+    # imported this module, and its own file of unexported transcripts.
+    TRANSCRIPT_EXPORTER.spill_path = f"{CONFIG.EXPORT_SPILL_PATH}.{worker_id}"
+    web.run_app(
+        init_func(None),
+        host="0.0.0.0",
+        port=CONFIG.PORT,
+        reuse_port=True,
+        shutdown_timeout=CONFIG.SHUTDOWN_TIMEOUT,
+        print=None,
+    )
+
 if __name__ == "__main__":
-    app = init_func(None)
-    try:
-        web.run_app(app, host="0.0.0.0", port=CONFIG.PORT)
-    except Exception as error:
-        raise error
+    if CONFIG.WORKERS > 1 and hasattr(socket, "SO_REUSEPORT"):
+        if CONFIG.STORAGE_BACKEND == "memory":
+            raise Exception(
+                "[app]: WORKERS > 1 requires a shared storage. Set STORAGE_BACKEND to sqlite"
+            )
+        WorkerSupervisor(run_worker, CONFIG.WORKERS, CONFIG.SHUTDOWN_TIMEOUT).run()
+    else:
+        app = init_func(None)
+        try:
+            web.run_app(app, host="0.0.0.0", port=CONFIG.PORT, shutdown_timeout=CONFIG.SHUTDOWN_TIMEOUT)
+        except Exception as error:
+            raise error
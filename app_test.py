@@ -1,22 +1,66 @@
+import asyncio
+import copy
+import io
+import json
+import logging
+import os
+import signal
+import tempfile
+import threading
+import time
+from unittest import mock
 import aiounittest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
 
 from botbuilder.core import (
     ConversationState,
     UserState,
     MemoryStorage,
+    IntentScore,
+    RecognizerResult,
+    TurnContext,
 )
 
 from botbuilder.azure import CosmosDbConfig, CosmosDbStorage
 from botbuilder.core.adapters import TestAdapter
 from botbuilder.testing.dialog_test_client import DialogTestClient
+from botbuilder.schema import Activity, ActivityTypes, ChannelAccount, ConversationAccount
 
 from config import DefaultConfig
 from dialogs import MainDialog
 from dialogs.booking_dialog import BookingDialog
 from bots import ValidationBot
 from flight_booking_recognizer import FlightBookingRecognizer
+from local_flight_booking_recognizer import LocalFlightBookingRecognizer
 from booking_details import BookingDetails
-from middleware1 import Middleware1
+from middleware1 import Middleware1, Middleware2
+from storage import CachedStorage, ConversationLeases, ETagConflictError, LazyStorage, SqliteStorage
+from helpers.log_helper import SamplingFilter
+from helpers.luis_evaluation import iter_utterances
+from helpers import (
+    ActivityParser,
+    AdmissionControl,
+    BufferedTelemetryQueue,
+    CardRegistry,
+    ConversationLocks,
+    DialogRuntime,
+    FileTelemetrySender,
+    LazyRecognizer,
+    LogHelper,
+    LuisHelper,
+    RecordedRecognizer,
+    SharedHttpSession,
+    StateWriteCoordinator,
+    TimexCache,
+    TranscriptExporter,
+    TurnMetrics,
+    UtteranceCache,
+    WorkerSupervisor,
+)
+from data_model import Transcript
+from applicationinsights import TelemetryClient
+from applicationinsights.channel import SenderBase, TelemetryChannel
 
 CONFIG = DefaultConfig()
 
@@ -121,4 +165,932 @@ class BookingDialogDetailsMiddleWare(aiounittest.AsyncTestCase):
             "\nYou want to spend less than: $ 500."
             " (1) Yes or (2) No"
         )
-        assert reply.text == message
\ No newline at end of file
+        assert reply.text == message
+
+class CountingRecognizer:
+    def __init__(self):
+        self.calls = 0
+
+    @property
+    def is_configured(self) -> bool:
+        return True
+
+    async def recognize(self, turn_context):
+        self.calls += 1
+        return RecognizerResult(
+            text=turn_context.activity.text,
+            intents={"inform": IntentScore(0.9)},
+            entities={
+                "$instance": {"dst_city": [{"text": "berlin"}]},
+                "dst_city": ["berlin"],
+            },
+        )
+
+class TurnRecognitionCacheTest(aiounittest.AsyncTestCase):
+    async def test_single_recognition_per_turn(self):
+        recognizer = CountingRecognizer()
+        turn_context = TurnContext(
+            TestAdapter(),
+            Activity(type=ActivityTypes.message, id="1", text="to Berlin"),
+        )
+        hits = LuisHelper.turn_cache.hits
+
+        _, _, first = await LuisHelper.execute_luis_query(recognizer, turn_context)
+        intent, _, second = await LuisHelper.execute_luis_query(recognizer, turn_context)
+
+        assert recognizer.calls == 1
+        assert LuisHelper.turn_cache.hits == hits + 1
+        assert intent == "inform"
+        assert second.destination == first.destination == "berlin"
+        assert second is not first
+
+
+class UtteranceCacheTest(aiounittest.AsyncTestCase):
+    async def test_lru_and_ttl(self):
+        now = [0.0]
+        cache = UtteranceCache(max_size=2, ttl=10.0, model_id="app:1", clock=lambda: now[0])
+
+        cache.set("Hi", RecognizerResult(text="Hi", intents={"None": IntentScore(0.8)}))
+        cache.set("Paris", RecognizerResult(text="Paris", intents={"inform": IntentScore(0.9)}))
+
+        assert cache.get("  hi ").text == "  hi "
+        cache.set("yes", RecognizerResult(text="yes", intents={"None": IntentScore(0.7)}))
+        assert cache.get("paris") is None
+        assert cache.evictions == 1
+
+        now[0] = 11.0
+        assert cache.get("hi") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.memory_usage > 0
+
+
+class DialogRuntimeTest(aiounittest.AsyncTestCase):
+    async def test_dialog_set_is_shared_by_the_turns(self):
+        conversation_state = ConversationState(MemoryStorage())
+        user_state = UserState(MemoryStorage())
+        dialog = MainDialog(
+            CountingRecognizer(),
+            BookingDialog(user_state=user_state, con_state=conversation_state),
+        )
+        runtime = DialogRuntime(dialog, conversation_state)
+        dialog_set = runtime.dialog_set
+        contexts = []
+        create_context = dialog_set.create_context
+
+        async def counting_create_context(turn_context):
+            contexts.append(turn_context)
+            return await create_context(turn_context)
+
+        dialog_set.create_context = counting_create_context
+
+        async def logic(turn_context):
+            await runtime.run(turn_context)
+            await conversation_state.save_changes(turn_context)
+
+        adapter = TestAdapter(logic)
+        await adapter.receive_activity("hi")
+        await adapter.receive_activity("to Berlin")
+
+        assert runtime.dialog_set is dialog_set
+        assert len(contexts) == 2
+        assert adapter.activity_buffer[-1].text == "From what city will you be travelling?"
+
+
+class TimexCacheTest(aiounittest.AsyncTestCase):
+    async def test_parsed_types_are_cached(self):
+        info = TimexCache.cache_info()
+
+        assert TimexCache.is_definite("2031-07-14")
+        assert not TimexCache.is_definite("XXXX-07-14")
+        assert {"definite", "date"} <= TimexCache.types("2031-07-14")
+        assert "definite" not in TimexCache.types("XXXX-07-14")
+        assert isinstance(TimexCache.types("2031-07-14"), frozenset)
+
+        assert TimexCache.cache_info().misses == info.misses + 2
+        assert TimexCache.cache_info().hits == info.hits + 3
+
+
+class CardRegistryTest(aiounittest.AsyncTestCase):
+    async def test_shared_attachments_reloaded_on_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("first", "second"):
+                with open(os.path.join(directory, f"{name}.json"), "w") as card_file:
+                    json.dump({"type": "AdaptiveCard", "body": [name]}, card_file)
+            now = [0.0]
+            registry = CardRegistry(directory, reload_interval=5.0, clock=lambda: now[0])
+
+            registry.preload()
+            assert sorted(registry._cards) == ["first", "second"]
+            attachment = registry.get("first")
+            assert registry.get("first") is attachment
+            assert attachment.content["body"] == ["first"]
+
+            path = os.path.join(directory, "first.json")
+            with open(path, "w") as card_file:
+                json.dump({"type": "AdaptiveCard", "body": ["changed"]}, card_file)
+            os.utime(path, ns=(1, 1))
+
+            # Not stat'ed again before the reload interval.
+            now[0] = 4.0
+            assert registry.get("first") is attachment
+            now[0] = 5.0
+            assert registry.get("first").content["body"] == ["changed"]
+            assert registry.get("second").content["body"] == ["second"]
+
+
+class LogHelperTest(aiounittest.AsyncTestCase):
+    async def test_structured_sampled_logs(self):
+        assert LogHelper.parse_sampling(" luis=0.1, dialogs=0 ,") == {"luis": 0.1, "dialogs": 0.0}
+
+        sampling = SamplingFilter({"dialogs": 0.0})
+        record = logging.LogRecord("bot.dialogs", logging.INFO, __file__, 1, "step", None, None)
+        assert not sampling.filter(record)
+        record.levelno = logging.WARNING
+        assert sampling.filter(record)
+
+        stream = io.StringIO()
+        LogHelper._exit_handler_registered = False
+        with mock.patch("atexit.register") as register:
+            LogHelper.configure("INFO", "dialogs=0", stream)
+            LogHelper.configure("INFO", "dialogs=0", stream)
+        assert register.call_count == 1
+
+        LogHelper.get_logger("dialogs").info("dropped")
+        try:
+            raise ValueError("bad date")
+        except ValueError:
+            LogHelper.get_logger("luis").exception("Failed", extra={"fields": {"turn": 3}})
+        LogHelper.shutdown()
+        root = logging.getLogger("bot")
+        root.handlers.clear()
+        root.propagate = True
+        root.setLevel(logging.NOTSET)
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert len(lines) == 1
+        assert lines[0]["category"] == "luis"
+        assert lines[0]["level"] == "ERROR"
+        assert lines[0]["turn"] == 3
+        assert "ValueError: bad date" in lines[0]["exception"]
+
+
+class TranscriptTest(aiounittest.AsyncTestCase):
+    async def test_bounded_transcript(self):
+        transcript = Transcript(max_entries=3)
+        transcript.append_user("hi")
+        transcript.append_bot("Where to?")
+        transcript.append_user("Paris")
+        transcript.append_bot("From where?")
+
+        assert len(transcript) == 3
+        assert transcript.lines() == [
+            "[...]: 1 earlier lines", "[Bot]: Where to?", "[User]: Paris", "[Bot]: From where?",
+        ]
+        assert transcript.total == 4
+
+        restored = copy.deepcopy(transcript)
+        assert restored.lines() == transcript.lines()
+        assert restored.total == transcript.total
+
+
+class FailingStorage(MemoryStorage):
+    async def write(self, changes):
+        raise Exception("store is down")
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super(CountingStorage, self).__init__()
+        self.writes = []
+
+    async def write(self, changes):
+        self.writes.append(sorted(changes))
+        await super(CountingStorage, self).write(changes)
+
+
+class SavesCountingState(ConversationState):
+    saves = 0
+
+    async def save_changes(self, turn_context, force=False):
+        SavesCountingState.saves += 1
+        await super(SavesCountingState, self).save_changes(turn_context, force)
+
+
+class StateWriteCoordinatorTest(aiounittest.AsyncTestCase):
+    @staticmethod
+    def pipeline(storage, coordinated: bool) -> TestAdapter:
+        conversation_state = SavesCountingState(storage)
+        user_state = UserState(storage)
+        dialog = MainDialog(
+            CountingRecognizer(),
+            BookingDialog(user_state=user_state, con_state=conversation_state),
+        )
+        adapter = TestAdapter(ValidationBot(conversation_state, user_state, dialog).on_turn)
+        if coordinated:
+            adapter.use(StateWriteCoordinator(storage, [conversation_state, user_state]))
+        adapter.use(Middleware1(CountingRecognizer()))
+        adapter.use(Middleware2(conversation_state, TranscriptExporter(MemoryStorage())))
+        return adapter
+
+    async def test_one_write_per_turn(self):
+        SavesCountingState.saves = 0
+        storage = CountingStorage()
+        adapter = self.pipeline(storage, coordinated=True)
+        await adapter.receive_activity("hi")
+        await adapter.receive_activity("to Berlin")
+        assert len(storage.writes) == 2
+        assert SavesCountingState.saves == 0
+
+        # Without the coordinator, Middleware2 and the bot save on their own.
+        adapter = self.pipeline(CountingStorage(), coordinated=False)
+        await adapter.receive_activity("hi")
+        assert SavesCountingState.saves == 2
+
+    async def test_states_not_loaded_are_skipped(self):
+        storage = CountingStorage()
+        conversation_state = ConversationState(storage)
+        user_state = UserState(storage)
+        coordinator = StateWriteCoordinator(storage, [conversation_state, user_state])
+        turn_context = TurnContext(
+            TestAdapter(),
+            Activity(
+                type=ActivityTypes.message,
+                channel_id="test",
+                conversation=ConversationAccount(id="conversation"),
+                from_property=ChannelAccount(id="user"),
+                text="hi",
+            ),
+        )
+
+        async def logic():
+            assert StateWriteCoordinator.is_active(turn_context)
+            await conversation_state.create_property("count").set(turn_context, 1)
+
+        await coordinator.on_turn(turn_context, logic)
+        await coordinator.on_turn(turn_context, lambda: asyncio.sleep(0))
+
+        assert storage.writes == [[conversation_state.get_storage_key(turn_context)]]
+        assert coordinator.writes == 1
+
+
+class TranscriptExporterTest(aiounittest.AsyncTestCase):
+    async def test_batches_and_spills(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+
+        down = TranscriptExporter(FailingStorage(), max_retries=2, backoff=0.0, spill_path=spill_path)
+        await down.stop()
+        down.enqueue("a1", ["[User]: hi"])
+        await down.flush()
+        assert down.spilled == 1 and down.retries == 1
+
+        storage = MemoryStorage()
+        exporter = TranscriptExporter(storage, batch_size=2, flush_interval=60.0, spill_path=spill_path)
+        # Started by the first document, without the startup hook.
+        exporter.enqueue("a2", ["[User]: paris"])
+        assert exporter._task is not None
+        exporter.enqueue("a3", ["[User]: rome"])
+        await exporter.stop()
+
+        assert exporter.exported == 3 and exporter.batches == 2
+        assert (await storage.read(["a1"]))["a1"] == ["[User]: hi"]
+        assert not os.path.exists(spill_path)
+
+
+class SqliteStorageTest(aiounittest.AsyncTestCase):
+    async def test_round_trip_and_etags(self):
+        storage = SqliteStorage(os.path.join(tempfile.mkdtemp(), "state.sqlite3"))
+        try:
+            item = {"conversation": Transcript(max_entries=5)}
+            item["conversation"].append_user("hi")
+            await storage.write({"conv1": item, "conv2": {"count": 1}})
+            assert item["e_tag"] == "1"
+
+            items = await storage.read(["conv1", "conv2", "missing"])
+            assert set(items) == {"conv1", "conv2"}
+            assert items["conv1"]["conversation"].lines() == ["[User]: hi"]
+
+            await storage.write({"conv2": items["conv2"]})
+            with self.assertRaises(ETagConflictError):
+                await storage.write({"conv1": {"e_tag": "1"}, "conv2": dict(items["conv2"], e_tag="1")})
+            # The whole batch is rolled back.
+            assert "conversation" in (await storage.read(["conv1"]))["conv1"]
+
+            await storage.delete(["conv1"])
+            assert list(await storage.read(["conv1", "conv2"])) == ["conv2"]
+        finally:
+            storage.close()
+        # Closed again by the application cleanup.
+        await storage.on_cleanup(None)
+
+
+def train_example(text, intent, entities):
+    labels = []
+    for entity, value in entities:
+        start = text.find(value)
+        labels.append({
+            "entity_name": entity,
+            "start_char_index": start,
+            "end_char_index": start + len(value),
+        })
+    return {"text": text, "intent_name": intent, "entity_labels": labels}
+
+TRAIN_UTTERANCES = [
+    train_example(
+        "I'd like to go from Paris to Berlin on august 3 and come back august 10 for $2000",
+        "inform",
+        [("or_city", "Paris"), ("dst_city", "Berlin"), ("str_date", "august 3"),
+         ("end_date", "august 10"), ("budget", "$2000")],
+    ),
+    train_example("Book a trip from Toronto to Tokyo", "inform",
+                  [("or_city", "Toronto"), ("dst_city", "Tokyo")]),
+    train_example("i want to travel to london", "inform", [("dst_city", "london")]),
+    train_example("thank you very much", "None", []),
+    train_example("ok great bye", "None", []),
+]
+
+class LocalRecognizerTest(aiounittest.AsyncTestCase):
+    async def test_local_recognizer_with_luis_helper(self):
+        recognizer = LocalFlightBookingRecognizer(train_utterances=TRAIN_UTTERANCES)
+        assert recognizer.is_configured
+
+        turn_context = TurnContext(
+            TestAdapter(),
+            Activity(
+                type=ActivityTypes.message,
+                id="local",
+                text="fly from berlin to Paris on sep 2 back sep 9 for 500 dollars",
+            ),
+        )
+        intent, score, result = await LuisHelper.execute_luis_query(recognizer, turn_context)
+
+        assert intent == "inform" and score > 0.5
+        assert result.origin == "berlin"
+        assert result.destination == "paris"
+        assert result.budget == "500 dollars"
+        assert result.travel_start_date.endswith("-09-02")
+        assert result.travel_end_date.endswith("-09-09")
+
+
+class LuisEvaluationTest(aiounittest.AsyncTestCase):
+    async def test_evaluate_recorded_predictions(self):
+        recognizer = RecordedRecognizer([
+            {
+                "text": "from Paris to Rome",
+                "intents": {"inform": {"score": 0.9}, "None": {"score": 0.1}},
+                "entities": {"$instance": {
+                    "or_city": [{"startIndex": 5, "endIndex": 10, "text": "paris"}],
+                    "dst_city": [{"startIndex": 5, "endIndex": 10, "text": "paris"}],
+                }},
+            },
+        ])
+        utterances = [
+            {
+                "text": "from Paris to Rome",
+                "intent": "inform",
+                "entities": [
+                    {"entity": "or_city", "startPos": 5, "endPos": 10},
+                    {"entity": "dst_city", "startPos": 14, "endPos": 18},
+                ],
+            },
+            {"text": "bye", "intent": "None", "entities": []},
+        ]
+
+        report = await LuisHelper.evaluate(recognizer, utterances, concurrency=2)
+        scores = report.entity_scores()
+
+        assert report.utterances == 2
+        assert report.intent_accuracy == 1.0
+        assert scores["or_city"] == {"precision": 1.0, "recall": 1.0}
+        assert scores["dst_city"] == {"precision": 0.0, "recall": 0.0}
+        assert report.as_dict()["latency"]["p99"] >= 0.0
+
+    def test_iter_utterances_reads_by_chunks(self):
+        utterances = [{"text": f"to rome {index} \u00e9", "intent": "inform", "entities": []} for index in range(20)]
+        path = os.path.join(tempfile.mkdtemp(), "test_utterances.json")
+        with open(path, "w") as utterances_file:
+            json.dump(utterances, utterances_file, indent=1)
+
+        assert list(iter_utterances(path, chunk_size=16)) == utterances
+        with open(path, "a") as utterances_file:
+            utterances_file.truncate(os.path.getsize(path) - 3)
+        with self.assertRaises(ValueError):
+            list(iter_utterances(path, chunk_size=16))
+
+
+class CachedStorageTest(aiounittest.AsyncTestCase):
+    async def test_read_through_and_conflicts(self):
+        backend = SqliteStorage(os.path.join(tempfile.mkdtemp(), "state.sqlite3"))
+        storage = CachedStorage(backend, max_size=1)
+        try:
+            await storage.write({"conv1": {"turns": 1}})
+            item = (await storage.read(["conv1"]))["conv1"]
+            item["turns"] += 1
+            assert (await storage.read(["conv1"]))["conv1"]["turns"] == 1
+            assert storage.hits == 2 and storage.misses == 0
+
+            # Another worker wrote the conversation.
+            await backend.write({"conv1": {"turns": 5}})
+            with self.assertRaises(KeyError):
+                await storage.write({"conv1": item})
+            assert (await storage.read(["conv1"]))["conv1"]["turns"] == 5
+            assert storage.misses == 1
+
+            await storage.write({"conv2": {"turns": 1}})
+            assert len(storage) == 1 and storage.evictions == 1
+        finally:
+            backend.close()
+
+
+class ActivityParserTest(aiounittest.AsyncTestCase):
+    async def test_matches_generic_deserializer(self):
+        from helpers.activity_parser import SAMPLE_ACTIVITY
+
+        update = dict(SAMPLE_ACTIVITY, type="conversationUpdate", membersAdded=[{"id": "user"}])
+        with_attachment = dict(SAMPLE_ACTIVITY, attachments=[{"contentType": "image/png"}])
+        for body in (SAMPLE_ACTIVITY, update, with_attachment):
+            data = json.dumps(body).encode("utf-8")
+            activity = ActivityParser.parse(ActivityParser.loads(data))
+            assert activity.serialize() == Activity().deserialize(body).serialize()
+
+
+class SharedHttpSessionTest(aiounittest.AsyncTestCase):
+    async def test_luis_clients_share_the_pool_and_send_the_key(self):
+        from helpers.load_test import FAKE_LUIS_APP_ID, FAKE_LUIS_KEY, FakeServices
+
+        services = FakeServices({
+            "to Berlin": {
+                "query": "to Berlin",
+                "topScoringIntent": {"intent": "inform", "score": 0.9},
+                "intents": [{"intent": "inform", "score": 0.9}],
+                "entities": [],
+            },
+        })
+        services.start()
+        try:
+            config = DefaultConfig()
+            config.LUIS_APP_ID = FAKE_LUIS_APP_ID
+            config.LUIS_API_KEY = FAKE_LUIS_KEY
+            config.LUIS_API_HOST_NAME = services.url
+            http_session = SharedHttpSession(pool_size=4)
+            recognizer = FlightBookingRecognizer(config, http_session=http_session)
+            luis = recognizer._recognizer
+            runtime_config = luis._build_recognizer(luis._options)._runtime.config
+            assert luis._build_recognizer(luis._options)._runtime.config is runtime_config
+
+            for index in range(2):
+                turn_context = TurnContext(
+                    TestAdapter(),
+                    Activity(
+                        type=ActivityTypes.message,
+                        id=str(index),
+                        text="to Berlin",
+                        from_property=ChannelAccount(id="user"),
+                        recipient=ChannelAccount(id="bot"),
+                        conversation=ConversationAccount(id="shared-session"),
+                    ),
+                )
+                result = await recognizer.recognize(turn_context)
+                assert result.get_top_scoring_intent().intent == "inform"
+        finally:
+            services.stop()
+        http_session.close()
+
+        assert services.luis_calls == 2
+        assert services.luis_rejected == 0
+        assert http_session.stats()["requests"] == 2
+
+
+class SlowRecognizer:
+    # Runs on the worker threads of FlightBookingRecognizer, as the LUIS client.
+    def __init__(self, delays, error: Exception = None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    async def recognize(self, turn_context):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        if delay is None:
+            self.release.wait(5)
+        else:
+            await asyncio.sleep(delay)
+        if self.error is not None:
+            raise self.error
+        return RecognizerResult(
+            text=turn_context.activity.text,
+            intents={"book": IntentScore(0.8)},
+            entities={"$instance": {}},
+        )
+
+
+def bounded_recognizer(
+    luis, fallback=None, telemetry_client=None, **settings
+) -> FlightBookingRecognizer:
+    config = DefaultConfig()
+    config.LUIS_APP_ID = "12345678-1234-1234-1234-123456789012"
+    config.LUIS_API_KEY = "12345678123412341234123456789012"
+    config.LUIS_API_HOST_NAME = "https://westeurope.api.cognitive.microsoft.com"
+    config.LUIS_CACHE_ENABLED = False
+    config.LUIS_HEDGING = False
+    for name, value in settings.items():
+        setattr(config, name, value)
+    recognizer = FlightBookingRecognizer(
+        config, telemetry_client=telemetry_client, fallback_recognizer=fallback
+    )
+    if luis is not None:
+        recognizer._recognizer = luis
+    return recognizer
+
+
+def message(text: str, activity_id: str) -> TurnContext:
+    return TurnContext(
+        TestAdapter(), Activity(type=ActivityTypes.message, id=activity_id, text=text)
+    )
+
+
+class BoundedLuisCallTest(aiounittest.AsyncTestCase):
+    async def test_timeout_falls_back(self):
+        fallback = CountingRecognizer()
+        recognizer = bounded_recognizer(SlowRecognizer([0.5]), fallback, LUIS_TIMEOUT=0.05)
+
+        result = await recognizer.recognize(message("to Berlin", "1"))
+
+        assert result.get_top_scoring_intent().intent == "inform"
+        assert fallback.calls == 1
+        assert recognizer.stats()["timeouts"] == 1
+        assert recognizer.stats()["failures"] == 0
+
+    async def test_hedge_wins(self):
+        luis = SlowRecognizer([0.5, 0.0])
+        recognizer = bounded_recognizer(
+            luis, LUIS_TIMEOUT=2, LUIS_HEDGING=True, LUIS_HEDGE_DELAY=0.02
+        )
+
+        result = await recognizer.recognize(message("to Berlin", "1"))
+
+        assert result.get_top_scoring_intent().intent == "book"
+        assert luis.calls == 2
+        assert recognizer.hedges == 1
+        assert recognizer.timeouts == 0
+
+    async def test_failure_falls_back(self):
+        fallback = CountingRecognizer()
+        recognizer = bounded_recognizer(
+            SlowRecognizer([0.0], error=ValueError("LUIS down")), fallback, LUIS_TIMEOUT=1
+        )
+
+        result = await recognizer.recognize(message("to Berlin", "1"))
+
+        assert result.get_top_scoring_intent().intent == "inform"
+        assert recognizer.failures == 1
+        assert recognizer.timeouts == 0
+
+    async def test_queued_calls_are_cancelled_and_pending_calls_bounded(self):
+        luis = SlowRecognizer([None])
+        recognizer = bounded_recognizer(
+            luis, CountingRecognizer(), LUIS_TIMEOUT=0.05, LUIS_MAX_WORKERS=1, LUIS_MAX_PENDING=2
+        )
+
+        # The first call blocks the only worker; the second is queued behind it.
+        await recognizer.recognize(message("to Berlin", "1"))
+        await recognizer.recognize(message("to Paris", "2"))
+        assert recognizer.timeouts == 2
+        assert recognizer.stats()["pending_calls"] == 2
+
+        recognizer.max_pending = 1
+        result = await recognizer.recognize(message("to Rome", "3"))
+        assert result.get_top_scoring_intent().intent == "inform"
+        assert recognizer.overloads == 1
+
+        luis.release.set()
+        recognizer._executor.shutdown(wait=True)
+        # The queued call was cancelled before it reached LUIS.
+        assert luis.calls == 1
+
+    async def test_utterance_cache_hit_emits_the_luis_telemetry(self):
+        telemetry_client = mock.Mock()
+        recognizer = bounded_recognizer(None, telemetry_client=telemetry_client, LUIS_CACHE_ENABLED=True)
+        recognizer.utterance_cache.set(
+            "to Berlin", RecognizerResult(text="to Berlin", intents={"book": IntentScore(0.8)})
+        )
+        adapter = TestAdapter(send_trace_activities=True)
+        context = TurnContext(adapter, Activity(
+            type=ActivityTypes.message,
+            id="1",
+            text="to Berlin",
+            from_property=ChannelAccount(id="user"),
+            recipient=ChannelAccount(id="bot"),
+            conversation=ConversationAccount(id="conversation"),
+        ))
+
+        result = await recognizer.recognize(context)
+
+        assert result.get_top_scoring_intent().intent == "book"
+        name, properties, _ = telemetry_client.track_event.call_args[0]
+        assert name == "LuisResult" and properties["cached"] == "true"
+        trace = adapter.activity_buffer[-1]
+        assert trace.type == ActivityTypes.trace and trace.value["cached"] is True
+
+
+class WorkerSupervisorTest(aiounittest.AsyncTestCase):
+    def test_restarts_exited_workers_and_stops_on_sigterm(self):
+        # time.sleep(worker_id): worker 0 exits at once and is restarted.
+        supervisor = WorkerSupervisor(time.sleep, 2, shutdown_timeout=1, restart_delay=0.05)
+
+        def stop_after_restart():
+            deadline = time.monotonic() + 30
+            while not supervisor.restarts and time.monotonic() < deadline:
+                time.sleep(0.05)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        stopper = threading.Thread(target=stop_after_restart, daemon=True)
+        stopper.start()
+        supervisor.run()
+        stopper.join()
+
+        assert supervisor.restarts >= 1
+        assert not supervisor._processes
+        assert signal.getsignal(signal.SIGTERM) is not supervisor._stop
+
+
+class ConversationLocksTest(aiounittest.AsyncTestCase):
+    async def test_orders_turns_per_conversation(self):
+        locks = ConversationLocks()
+        events = []
+
+        async def turn(conversation_id, name, delay):
+            async with locks.hold(conversation_id):
+                events.append(f"{name}+")
+                await asyncio.sleep(delay)
+                events.append(f"{name}-")
+
+        await asyncio.gather(turn("c1", "a", 0.02), turn("c1", "b", 0.0), turn("c2", "c", 0.01))
+
+        assert events.index("a-") < events.index("b+")
+        assert events.index("c+") < events.index("a-")
+        assert locks.contended == 1 and len(locks) == 0
+
+    async def test_orders_turns_across_workers(self):
+        # Two workers: a storage and locks each, on the same database file.
+        path = os.path.join(tempfile.mkdtemp(), "state.sqlite3")
+        storages = [SqliteStorage(path), SqliteStorage(path)]
+        leases = [ConversationLeases(storage, ttl=5, poll_interval=0.005) for storage in storages]
+        workers = [ConversationLocks(lease) for lease in leases]
+        events = []
+
+        async def turn(locks, name, delay):
+            async with locks.hold("c1"):
+                events.append(f"{name}+")
+                await asyncio.sleep(delay)
+                events.append(f"{name}-")
+
+        try:
+            first = asyncio.ensure_future(turn(workers[0], "a", 0.05))
+            await asyncio.sleep(0.01)
+            await asyncio.gather(first, turn(workers[1], "b", 0.0))
+            assert events == ["a+", "a-", "b+", "b-"]
+            assert leases[1].waits == 1 and workers[1].stats()["lease_acquired"] == 1
+
+            # An expired lease is taken over.
+            assert await storages[0].acquire_lease("c2", leases[0].owner, ttl=0)
+            assert await storages[1].acquire_lease("c2", leases[1].owner, ttl=5)
+            assert not await storages[0].acquire_lease("c2", leases[0].owner, ttl=5)
+        finally:
+            for storage in storages:
+                storage.close()
+
+
+class AdmissionControlTest(aiounittest.AsyncTestCase):
+    async def test_sheds_past_the_queue(self):
+        admission = AdmissionControl(max_in_flight=1, max_queue=1, queue_timeout=0.05, retry_after=3)
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return web.Response()
+
+        app = web.Application(middlewares=[admission.middleware])
+        app.router.add_post("/api/messages", handler)
+        async with TestClient(TestServer(app)) as client:
+            first = asyncio.ensure_future(client.post("/api/messages"))
+            await asyncio.sleep(0.01)
+            queued = asyncio.ensure_future(client.post("/api/messages"))
+            await asyncio.sleep(0.01)
+            rejected = await client.post("/api/messages")
+            timed_out = await queued
+            release.set()
+            admitted = await first
+
+            assert rejected.status == 429 and rejected.headers["Retry-After"] == "3"
+            assert timed_out.status == 503
+            assert admitted.status == 200
+        assert admission.stats() == {
+            "in_flight": 0, "waiting": 0, "max_waiting": 1,
+            "admitted": 1, "shed_queue_full": 1, "shed_timeout": 1,
+        }
+
+    async def test_turns_waiting_for_their_conversation_hold_no_slot(self):
+        admission = AdmissionControl(max_in_flight=2, max_queue=0)
+        locks = ConversationLocks()
+        release = asyncio.Event()
+
+        async def handler():
+            await release.wait()
+            return web.Response()
+
+        async def message(conversation_id):
+            async with locks.hold(conversation_id):
+                return await admission.run(handler)
+
+        first = asyncio.ensure_future(message("c1"))
+        waiting = asyncio.ensure_future(message("c1"))
+        await asyncio.sleep(0.01)
+        other = asyncio.ensure_future(message("c2"))
+        await asyncio.sleep(0.01)
+        assert admission.in_flight == 2 and locks.contended == 1
+
+        release.set()
+        responses = await asyncio.gather(first, waiting, other)
+        assert [response.status for response in responses] == [200, 200, 200]
+        assert admission.stats()["shed_queue_full"] == 0
+
+
+class LoadTestPredictionsTest(aiounittest.AsyncTestCase):
+    async def test_predictions_from_frames_labels(self):
+        from helpers.load_test import prediction_from_labels
+
+        prediction = prediction_from_labels({
+            "text": "From Paris to Berlin please",
+            "labels": {"acts": [{"name": "inform", "args": [
+                {"key": "or_city", "val": "Paris"},
+                {"key": "dst_city", "val": "berlin"},
+                {"key": "intent", "val": "book"},
+            ]}]},
+        })
+
+        assert prediction["topScoringIntent"]["intent"] == "inform"
+        assert [(e["type"], e["startIndex"], e["endIndex"]) for e in prediction["entities"]] == [
+            ("or_city", 5, 9), ("dst_city", 14, 19),
+        ]
+
+
+class DialogBenchmarkTest(aiounittest.AsyncTestCase):
+    async def test_main_flow_is_timed_per_step(self):
+        from helpers.dialog_benchmark import build_scenarios, compare, run_benchmark
+
+        scenarios = [s for s in build_scenarios() if s.name == "main"]
+        results = await run_benchmark(scenarios, repeat=2, warmup=0)
+
+        main = results["scenarios"]["main"]
+        assert main["flow"]["count"] == 2
+        assert len(main["turns"]) == len(scenarios[0].turns)
+        assert "alloc_peak_kb" in main["turns"][0]
+        assert {"MainDialog.act_step", "BookingDialog.confirm_step"} <= set(main["steps"])
+
+        slower = copy.deepcopy(results)
+        slower["scenarios"]["main"]["flow"]["p50_ms"] *= 2
+        regressions = [row["metric"] for row in compare(slower, results) if row["regression"]]
+        assert regressions == ["main flow"]
+
+
+class TurnMetricsTest(aiounittest.AsyncTestCase):
+    async def test_spans_and_collectors_are_rendered(self):
+        # The stages and collectors registered by app.py are restored afterwards.
+        with mock.patch.object(TurnMetrics, "enabled", True), \
+                mock.patch.object(TurnMetrics, "_stages", {}), \
+                mock.patch.object(TurnMetrics, "_collectors", {}):
+            with TurnMetrics.span("storage.read"):
+                pass
+            TurnMetrics.observe("storage.read", 0.2)
+            TurnMetrics.register("locks", ConversationLocks().stats)
+
+            app = web.Application()
+            app.router.add_get("/metrics", TurnMetrics.handler)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/metrics")
+                body = await response.text()
+
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert 'bot_stage_seconds_bucket{stage="storage.read",le="0.1"} 1' in body
+        assert 'bot_stage_seconds_bucket{stage="storage.read",le="+Inf"} 2' in body
+        assert 'bot_stage_seconds_count{stage="storage.read"} 2' in body
+        assert "bot_locks_contended 0" in body
+
+
+class BufferedTelemetryQueueTest(aiounittest.AsyncTestCase):
+    async def test_buffer_drops_oldest_and_samples_per_type(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "telemetry.jsonl")
+            queue = BufferedTelemetryQueue(
+                FileTelemetrySender(path),
+                flush_interval=60,
+                max_buffer=3,
+                sampling={"WaterfallStep": 0.0},
+            )
+            client = TelemetryClient("key", TelemetryChannel(queue=queue))
+            for name in ("WaterfallStep", "E1", "E2", "E3", "E4"):
+                client.track_event(name)
+            client.flush()
+            queue.close()
+
+            with open(path) as sink:
+                names = [json.loads(line)["data"]["baseData"]["name"] for line in sink]
+
+        assert names == ["E2", "E3", "E4"]
+        assert queue.stats()["dropped"] == 1
+        assert queue.stats()["sampled_out"] == 1
+
+    async def test_retried_batch_keeps_its_order(self):
+        sender = FlakySender()
+        queue = BufferedTelemetryQueue(sender, batch_size=10, flush_interval=60)
+        client = TelemetryClient("key", TelemetryChannel(queue=queue))
+        for name in ("E1", "E2", "E3", "E4"):
+            client.track_event(name)
+        client.flush()
+
+        # The first batch fails, the second is put back, then sent on close.
+        queue.batch_size = 2
+        queue.close()
+        client.track_event("E5")
+        client.flush()
+
+        assert sender.sent == ["E3", "E4"]
+        assert queue.stats()["lost"] == 2 and queue.stats()["requeued"] == 2
+        assert queue.stats()["dropped"] == 1 and queue.stats()["buffered"] == 0
+
+
+class FlakySender(SenderBase):
+    def __init__(self):
+        super(FlakySender, self).__init__(None)
+        self.calls = 0
+        self.sent = []
+
+    def send(self, data_to_send):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError("unreachable")
+        if self.calls == 2:
+            # Like SenderBase on a failure: the items are put back one at a time.
+            for item in data_to_send:
+                self.queue.put(item)
+            return
+        self.sent.extend(item.data.base_data.name for item in data_to_send)
+
+
+class LazyComponentTest(aiounittest.AsyncTestCase):
+    async def test_components_are_built_once_on_first_use(self):
+        built = []
+
+        def create_storage():
+            built.append("storage")
+            return MemoryStorage()
+
+        storage = LazyStorage(create_storage, "storage")
+        assert not storage.built
+        await storage.write({"key": {"value": 1}})
+        assert (await storage.read(["key"]))["key"]["value"] == 1
+        assert built == ["storage"]
+
+        recognizer = LazyRecognizer(CountingRecognizer, "recognizer")
+        await recognizer.on_startup(None)
+        assert recognizer.built
+        assert recognizer.is_configured
+        assert recognizer.calls == 0
+
+
+class BlockingSender(SenderBase):
+    def __init__(self):
+        super(BlockingSender, self).__init__(None)
+        self.release = threading.Event()
+        self.batches = []
+        self.sending = 0
+        self.overlaps = 0
+
+    def send(self, data_to_send):
+        self.sending += 1
+        if self.sending > 1:
+            self.overlaps += 1
+        self.release.wait(5)
+        self.batches.append(len(data_to_send))
+        self.sending -= 1
+
+
+class TelemetryQueueCloseTest(aiounittest.AsyncTestCase):
+    def test_close_does_not_drain_while_the_thread_sends(self):
+        sender = BlockingSender()
+        queue = BufferedTelemetryQueue(sender, batch_size=1, flush_interval=60)
+        client = TelemetryClient("key", TelemetryChannel(queue=queue))
+        for name in ("E1", "E2", "E3"):
+            client.track_event(name)
+        client.flush()
+
+        # The background thread is blocked in its first batch.
+        queue.close(timeout=0.1)
+        sender.release.set()
+        queue._thread.join(5)
+
+        assert sender.overlaps == 0
+        assert sum(sender.batches) == 3
+        assert queue.stats()["buffered"] == 0
+
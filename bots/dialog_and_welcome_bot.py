@@ -1,9 +1,6 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
-import json
-import os.path
-
 from typing import List
 from botbuilder.dialogs import Dialog
 from botbuilder.core import (
@@ -15,7 +12,7 @@ from botbuilder.core import (
 )
 from botbuilder.schema import Attachment, ChannelAccount
 
-from helpers import DialogHelper
+from helpers import CardRegistry, DialogRuntime
 from .dialog_bot import DialogBot
 
 
@@ -27,11 +24,14 @@ class DialogAndWelcomeBot(DialogBot):
         user_state: UserState,
         dialog: Dialog,
         telemetry_client: BotTelemetryClient,
+        dialog_runtime: DialogRuntime = None,
+        card_registry: CardRegistry = None,
     ):
         super(DialogAndWelcomeBot, self).__init__(
-            conversation_state, user_state, dialog, telemetry_client
+            conversation_state, user_state, dialog, telemetry_client, dialog_runtime
         )
         self.telemetry_client = telemetry_client
+        self.card_registry = card_registry or CardRegistry()
 
     async def on_members_added_activity(
         self, members_added: List[ChannelAccount], turn_context: TurnContext
@@ -44,19 +44,8 @@ class DialogAndWelcomeBot(DialogBot):
                 welcome_card = self.create_adaptive_card_attachment()
                 response = MessageFactory.attachment(welcome_card)
                 await turn_context.send_activity(response)
-                await DialogHelper.run_dialog(
-                    self.dialog,
-                    turn_context,
-                    self.conversation_state.create_property("DialogState"),
-                )
-
-    # Load attachment from file.
-    def create_adaptive_card_attachment(self):
-        relative_path = os.path.abspath(os.path.dirname(__file__))
-        path = os.path.join(relative_path, "../cards/welcomeCard.json")
-        with open(path) as card_file:
-            card = json.load(card_file)
+                await self.dialog_runtime.run(turn_context)
 
-        return Attachment(
-            content_type="application/vnd.microsoft.card.adaptive", content=card
-        )
+    # Load attachment from the card registry (cards/welcomeCard.json).
+    def create_adaptive_card_attachment(self) -> Attachment:
+        return self.card_registry.get("welcomeCard")
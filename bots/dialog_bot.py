@@ -10,7 +10,7 @@ from botbuilder.core import (
     NullTelemetryClient,
 )
 from botbuilder.dialogs import Dialog
-from helpers import DialogHelper
+from helpers import DialogRuntime, StateWriteCoordinator
 
 
 class DialogBot(ActivityHandler):
@@ -20,6 +20,7 @@ class DialogBot(ActivityHandler):
         user_state: UserState,
         dialog: Dialog,
         telemetry_client: BotTelemetryClient,
+        dialog_runtime: DialogRuntime = None,
     ):
         if conversation_state is None:
             raise Exception("[DialogBot]: Missing parameter. conversation_state is required")
@@ -32,20 +33,19 @@ class DialogBot(ActivityHandler):
         self.user_state = user_state
         self.dialog = dialog
         self.telemetry_client = telemetry_client
+        self.dialog_runtime = dialog_runtime or DialogRuntime(dialog, conversation_state)
 
     async def on_turn(self, turn_context: TurnContext):
         await super().on_turn(turn_context)
 
-        # Save any state changes that might have occurred during the turn.
-        await self.conversation_state.save_changes(turn_context, False)
-        await self.user_state.save_changes(turn_context, False)
+        # Save any state changes that might have occurred during the turn,
+        # unless the StateWriteCoordinator saves them once the turn is over.
+        if not StateWriteCoordinator.is_active(turn_context):
+            await self.conversation_state.save_changes(turn_context, False)
+            await self.user_state.save_changes(turn_context, False)
 
     async def on_message_activity(self, turn_context: TurnContext):
-        await DialogHelper.run_dialog(
-            self.dialog,
-            turn_context,
-            self.conversation_state.create_property("DialogState"),
-        )
+        await self.dialog_runtime.run(turn_context)
 
     @property
     def telemetry_client(self) -> BotTelemetryClient:
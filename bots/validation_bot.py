@@ -4,7 +4,7 @@
 from botbuilder.core import ActivityHandler, ConversationState, UserState, TurnContext
 from botbuilder.dialogs import Dialog
 
-from helpers import DialogHelper
+from helpers import DialogRuntime, StateWriteCoordinator
 
 
 class ValidationBot(ActivityHandler):
@@ -24,17 +24,16 @@ class ValidationBot(ActivityHandler):
         self.conversation_state = conversation_state
         self.user_state = user_state
         self.dialog = dialog
+        self.dialog_runtime = DialogRuntime(dialog, conversation_state)
 
     async def on_turn(self, turn_context: TurnContext):
         await super().on_turn(turn_context)
 
-        # Save any state changes that might have occurred during the turn.
-        await self.conversation_state.save_changes(turn_context, False)
-        await self.user_state.save_changes(turn_context, False)
+        # Save any state changes that might have occurred during the turn,
+        # unless the StateWriteCoordinator saves them once the turn is over.
+        if not StateWriteCoordinator.is_active(turn_context):
+            await self.conversation_state.save_changes(turn_context, False)
+            await self.user_state.save_changes(turn_context, False)
 
     async def on_message_activity(self, turn_context: TurnContext):
-        await DialogHelper.run_dialog(
-            self.dialog,
-            turn_context,
-            self.conversation_state.create_property("DialogState"),
-        )
+        await self.dialog_runtime.run(turn_context)
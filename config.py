@@ -16,11 +16,89 @@ class DefaultConfig:
     LUIS_APP_ID = os.getenv("LUIS_APP_ID")
     LUIS_API_KEY = os.getenv("PREDICTION_KEY")
     LUIS_API_HOST_NAME = os.getenv("PREDICTION_ENDPOINT")
+    LUIS_APP_VERSION = os.getenv("LUIS_APP_VERSION", "")
+    # Cross-conversation cache of LUIS results, keyed on the normalized utterance.
+    LUIS_CACHE_ENABLED = os.getenv("LUIS_CACHE_ENABLED", "False").lower() == "true"
+    LUIS_CACHE_SIZE = int(os.getenv("LUIS_CACHE_SIZE", "1024"))
+    LUIS_CACHE_TTL = float(os.getenv("LUIS_CACHE_TTL", "3600"))
+    # Latency budget of a LUIS call in seconds (0 disables it) and request hedging.
+    # A hedge delay of 0 uses the p95 of the recent LUIS latencies.
+    LUIS_TIMEOUT = float(os.getenv("LUIS_TIMEOUT", "0"))
+    LUIS_HEDGING = os.getenv("LUIS_HEDGING", "False").lower() == "true"
+    LUIS_HEDGE_DELAY = float(os.getenv("LUIS_HEDGE_DELAY", "0"))
+    LUIS_MAX_WORKERS = int(os.getenv("LUIS_MAX_WORKERS", "8"))
+    # LUIS calls started and not finished, including the abandoned ones, past
+    # which the turns go straight to the fallback recognizer.
+    LUIS_MAX_PENDING = int(os.getenv("LUIS_MAX_PENDING", "16"))
+    # "luis" for the remote LUIS application, "local" for the in-process recognizer
+    # trained from the utterances produced by P10_01_data_prep.ipynb.
+    RECOGNIZER_BACKEND = os.getenv("RECOGNIZER_BACKEND", "luis")
+    LOCAL_RECOGNIZER_TRAIN_FILE = os.getenv(
+        "LOCAL_RECOGNIZER_TRAIN_FILE", "data/train_utterances.json"
+    )
+    # Structured logging: level of the bot loggers and per-category sampling
+    # rates of the records below WARNING, e.g. "luis=0.1,dialogs=0.5".
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")
+    LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+    # Seconds between two checks of the card files for changes.
+    CARDS_RELOAD_INTERVAL = float(os.getenv("CARDS_RELOAD_INTERVAL", "5"))
+    # Lines of a conversation kept in its state (the older ones are only counted).
+    TRANSCRIPT_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_MAX_ENTRIES", "100"))
+    # Keep-alive connections kept per host by the connection pool shared by the LUIS
+    # and Bot Connector clients; with HTTP_POOL_BLOCK no more are ever opened.
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+    HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "False").lower() == "true"
+    # Turns processed at once on /api/messages (0 for no limit), requests waiting
+    # for a slot, seconds they may wait, and Retry-After of the shed requests.
+    MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "64"))
+    MAX_QUEUE = int(os.getenv("MAX_QUEUE", "128"))
+    QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "2"))
+    RETRY_AFTER = int(os.getenv("RETRY_AFTER", "1"))
+    # Largest request body accepted on /api/messages, in bytes.
+    MAX_BODY_SIZE = int(os.getenv("MAX_BODY_SIZE", str(256 * 1024)))
+    # Worker processes sharing the port (SO_REUSEPORT, Linux only), and seconds
+    # given to the pending requests on shutdown. Several workers require the
+    # sqlite storage, the memory storage is not shared.
+    WORKERS = int(os.getenv("WORKERS", "1"))
+    SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+    # SO_REUSEPORT spreads the connections, not the conversations, over the
+    # workers: they order the turns of a conversation with a lease in the sqlite
+    # storage, which expires after CONVERSATION_LEASE_TTL seconds.
+    CONVERSATION_LEASE_TTL = float(os.getenv("CONVERSATION_LEASE_TTL", "30"))
+    # Storage of the user and conversation states: "memory" (lost on restart) or
+    # "sqlite", a database file that several worker processes can share.
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+    STORAGE_PATH = os.getenv("STORAGE_PATH", "state/bot_state.sqlite3")
+    # States kept in memory in front of a persistent storage (0 disables the cache).
+    # Only used with a single worker: the other workers change the states it holds.
+    STORAGE_CACHE_SIZE = int(os.getenv("STORAGE_CACHE_SIZE", "1000"))
+    # Durations of the stages of the turns and statistics of the components,
+    # served in the Prometheus text format on METRICS_PATH. Off by default: the
+    # path is served on the public port of the bot, next to /api/messages.
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False").lower() == "true"
+    METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
     APPINSIGHTS_INSTRUMENTATION_KEY = os.getenv("APPINSIGHTS_INSTRUMENTATION_KEY")
+    # Telemetry sent by a background thread: items per batch, seconds between two
+    # sends, items buffered before the oldest are dropped, and per-type sampling
+    # rates, e.g. "WaterfallStep=0.1,request=0.5". The sink is "appinsights",
+    # "stdout" or "file" (JSON lines written to TELEMETRY_FILE).
+    TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "100"))
+    TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "5"))
+    TELEMETRY_MAX_BUFFER = int(os.getenv("TELEMETRY_MAX_BUFFER", "10000"))
+    TELEMETRY_SAMPLING = os.getenv("TELEMETRY_SAMPLING", "")
+    TELEMETRY_SINK = os.getenv("TELEMETRY_SINK", "appinsights")
+    TELEMETRY_FILE = os.getenv("TELEMETRY_FILE", "telemetry/telemetry.jsonl")
     DB_ENDPOINT = os.getenv("DB_ENDPOINT")
     DB_KEY = os.getenv("DB_KEY")
     DB_NAME = os.getenv("DB_NAME")
     DB_CONTAINER_NAME = os.getenv("DB_CONTAINER_NAME")
+    # Background export of the failed conversations to Cosmos DB: documents per
+    # write, seconds between two flushes, attempts per batch and the file where
+    # the batches that could not be written are kept until the next start.
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "20"))
+    EXPORT_FLUSH_INTERVAL = float(os.getenv("EXPORT_FLUSH_INTERVAL", "2"))
+    EXPORT_MAX_RETRIES = int(os.getenv("EXPORT_MAX_RETRIES", "5"))
+    EXPORT_SPILL_PATH = os.getenv("EXPORT_SPILL_PATH", "export/failed_transcripts.jsonl")
 
 
     # print("APP_ID",APP_ID)
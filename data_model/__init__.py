@@ -1,3 +1,4 @@
 from .states import ConState
+from .transcript import Transcript
 
-__all__ = ["ConState"]
\ No newline at end of file
+__all__ = ["ConState", "Transcript"]
@@ -1,4 +1,7 @@
+from .transcript import Transcript
+
+
 class ConState:
-    def __init__(self):
+    def __init__(self, transcript_max_entries: int = 100):
         self.failed = False
-        self.conversation = []
\ No newline at end of file
+        self.conversation = Transcript(transcript_max_entries)
@@ -0,0 +1,66 @@
+from collections import deque
+from typing import List
+
+USER = "U"
+BOT = "B"
+PREFIXES = {USER: "[User]: ", BOT: "[Bot]: "}
+
+
+class Transcript:
+    """
+    Bounded transcript of a conversation: a ring buffer of the last
+    'max_entries' lines, plus counters of the lines that rolled out of it.
+    It serializes to a compact dict (roles as one string, texts as one list).
+    """
+
+    __slots__ = ("max_entries", "_roles", "_texts", "total", "dropped")
+
+    def __init__(self, max_entries: int = 100):
+        self.max_entries = max_entries
+        self._roles = deque(maxlen=max_entries)
+        self._texts = deque(maxlen=max_entries)
+        # Lines ever appended / rolled out of the buffer.
+        self.total = 0
+        self.dropped = 0
+
+    def _append(self, role: str, text: str) -> None:
+        if len(self._texts) == self.max_entries:
+            self.dropped += 1
+        self._roles.append(role)
+        self._texts.append(text)
+        self.total += 1
+
+    def append_user(self, text: str) -> None:
+        self._append(USER, text)
+
+    def append_bot(self, text: str) -> None:
+        self._append(BOT, text)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def lines(self) -> List[str]:
+        """
+        The buffered lines in the "[User]: ..." / "[Bot]: ..." format, preceded by
+        a summary line when earlier lines were dropped.
+        """
+        lines = [PREFIXES[role] + text for role, text in zip(self._roles, self._texts)]
+        if self.dropped:
+            lines.insert(0, f"[...]: {self.dropped} earlier lines")
+        return lines
+
+    def __getstate__(self) -> dict:
+        return {
+            "n": self.max_entries,
+            "r": "".join(self._roles),
+            "t": list(self._texts),
+            "c": self.total,
+            "d": self.dropped,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.max_entries = state["n"]
+        self._roles = deque(state["r"], maxlen=self.max_entries)
+        self._texts = deque(state["t"], maxlen=self.max_entries)
+        self.total = state["c"]
+        self.dropped = state["d"]
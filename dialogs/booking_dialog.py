@@ -7,9 +7,8 @@ from botbuilder.dialogs.prompts import ConfirmPrompt, TextPrompt, PromptOptions
 from botbuilder.core import MessageFactory, UserState, BotTelemetryClient, NullTelemetryClient
 from botbuilder.schema import InputHints
 
-from datatypes_date_time.timex import Timex
-
 from data_model import ConState
+from helpers import TimexCache
 
 from .cancel_and_help_dialog import CancelAndHelpDialog
 from .date_resolver_dialog import DateResolverDialog
@@ -241,5 +240,4 @@ class BookingDialog(CancelAndHelpDialog):
 
 
     def is_ambiguous(self, timex: str) -> bool:
-        timex_property = Timex(timex)
-        return "definite" not in timex_property.types
+        return not TimexCache.is_definite(timex)
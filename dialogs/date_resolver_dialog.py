@@ -10,10 +10,11 @@ from botbuilder.dialogs.prompts import (
     DateTimeResolution,
 )
 from botbuilder.schema import InputHints
-from datatypes_date_time.timex import Timex
-
+from helpers import LogHelper, TimexCache
 from .cancel_and_help_dialog import CancelAndHelpDialog
 
+LOGGER = LogHelper.get_logger("dialogs")
+
 
 class DateResolverDialog(CancelAndHelpDialog):
     def __init__(
@@ -47,7 +48,7 @@ class DateResolverDialog(CancelAndHelpDialog):
         timex = step_context.options['date']
         direction = step_context.options['direction']
 
-        print(f"\n-------------[date_resolver_dialog.py] timex: {timex}-------------")
+        LOGGER.debug("Resolving date %s", timex, extra={"fields": {"direction": direction}})
 
         prompt_msg_text = "On what date would you like to travel " + direction + "?"
         prompt_msg = MessageFactory.text(
@@ -68,7 +69,7 @@ class DateResolverDialog(CancelAndHelpDialog):
                 PromptOptions(prompt=prompt_msg, retry_prompt=reprompt_msg),
             )
         # We have a Date we just need to check it is unambiguous.
-        if "definite" not in Timex(timex).types:
+        if not TimexCache.is_definite(timex):
             # This is essentially a "reprompt" of the data we were given up front.
             return await step_context.prompt(
                 DateTimePrompt.__name__, PromptOptions(prompt=reprompt_msg)
@@ -85,6 +86,6 @@ class DateResolverDialog(CancelAndHelpDialog):
         if prompt_context.recognized.succeeded:
             timex = prompt_context.recognized.value[0].timex.split("T")[0]
 
-            return "definite" in Timex(timex).types
+            return TimexCache.is_definite(timex)
 
         return False
@@ -1,8 +1,16 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from botbuilder.ai.luis import LuisApplication, LuisRecognizer, LuisPredictionOptions
+from botbuilder.ai.luis.activity_util import ActivityUtil
+from botbuilder.ai.luis.luis_util import LuisUtil
 from botbuilder.core import (
+    IntentScore,
     Recognizer,
     RecognizerResult,
     TurnContext,
@@ -11,10 +19,86 @@ from botbuilder.core import (
 )
 
 from config import DefaultConfig
+from helpers import RecordingAdapter, SharedHttpSession, TurnRecognitionCache, UtteranceCache
+
+# Number of recent LUIS latencies used to estimate the p95 hedging delay.
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+_THREAD_LOOPS = threading.local()
+
+
+def _run_in_thread(coroutine_function, *args) -> object:
+    # The LUIS runtime client blocks while waiting for the prediction, so the
+    # call runs to completion on an event loop owned by the worker thread.
+    # The coroutine is only created here, so that a call cancelled before it
+    # starts leaves nothing behind.
+    loop = getattr(_THREAD_LOOPS, "loop", None)
+    if loop is None:
+        loop = asyncio.new_event_loop()
+        _THREAD_LOOPS.loop = loop
+    return loop.run_until_complete(coroutine_function(*args))
+
+
+def _discard(future: asyncio.Future) -> None:
+    # Abandoned call: its result or error is not wanted.
+    if not future.cancelled():
+        future.exception()
+
+
+class _PooledLuisRecognizer(LuisRecognizer):
+    """
+    LuisRecognizer builds a new runtime client, with its own HTTP session, for
+    every call. This one builds it once per prediction options and sends its
+    requests on the shared session.
+    """
+
+    def __init__(self, *args, http_session: SharedHttpSession = None, **kwargs):
+        super(_PooledLuisRecognizer, self).__init__(*args, **kwargs)
+        self._http_session = http_session
+        self._recognizers = {}
+
+    def _build_recognizer(self, luis_prediction_options):
+        # The options are kept with their recognizer, so that their id is not reused.
+        _, recognizer = self._recognizers.get(id(luis_prediction_options), (None, None))
+        if recognizer is None:
+            recognizer = super(_PooledLuisRecognizer, self)._build_recognizer(
+                luis_prediction_options
+            )
+            if self._http_session is not None:
+                self._http_session.attach(recognizer._runtime.config)
+            self._recognizers[id(luis_prediction_options)] = (luis_prediction_options, recognizer)
+        return recognizer
+
 
 class FlightBookingRecognizer(Recognizer):
-    def __init__(self, configuration: DefaultConfig, telemetry_client: BotTelemetryClient = None):
+    def __init__(
+        self,
+        configuration: DefaultConfig,
+        telemetry_client: BotTelemetryClient = None,
+        fallback_recognizer: Recognizer = None,
+        http_session: SharedHttpSession = None,
+    ):
         self._recognizer = None
+        self._telemetry_client = telemetry_client or NullTelemetryClient()
+        self.turn_cache = TurnRecognitionCache("FlightBookingRecognizer.result")
+        self.utterance_cache = None
+
+        # Latency budget of a LUIS call (seconds, 0 means no deadline) and hedging.
+        # Past the budget the turn continues with the fallback recognizer's result.
+        self.timeout = configuration.LUIS_TIMEOUT
+        self.hedging = configuration.LUIS_HEDGING
+        self.hedge_delay = configuration.LUIS_HEDGE_DELAY
+        self.fallback_recognizer = fallback_recognizer
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._executor = None
+        self.max_pending = configuration.LUIS_MAX_PENDING
+        self._pending_calls = set()
+
+        self.timeouts = 0
+        self.hedges = 0
+        self.failures = 0
+        self.overloads = 0
 
         luis_is_configured = (
             configuration.LUIS_APP_ID
@@ -29,13 +113,27 @@ class FlightBookingRecognizer(Recognizer):
             )
 
             options = LuisPredictionOptions()
-            options.telemetry_client = telemetry_client or NullTelemetryClient()
+            options.telemetry_client = self._telemetry_client
 
-            self._recognizer = LuisRecognizer(
+            self._recognizer = _PooledLuisRecognizer(
                 luis_application,
                 prediction_options=options,
+                http_session=http_session,
             )
 
+            if configuration.LUIS_CACHE_ENABLED:
+                self.utterance_cache = UtteranceCache(
+                    max_size=configuration.LUIS_CACHE_SIZE,
+                    ttl=configuration.LUIS_CACHE_TTL,
+                    model_id=f"{configuration.LUIS_APP_ID}:{configuration.LUIS_APP_VERSION}",
+                )
+
+            if self.timeout or self.hedging:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=configuration.LUIS_MAX_WORKERS,
+                    thread_name_prefix="luis",
+                )
+
         # print("\n-------------[flicht_booking_recognizer.py] LUIS application id: "\
         #     f"{luis_application.application_id}-------------")
 
@@ -44,5 +142,188 @@ class FlightBookingRecognizer(Recognizer):
         # Returns true if luis is configured in the appsettings.json and initialized.
         return self._recognizer is not None
 
+    def stats(self) -> dict:
+        stats = {
+            "turn_cache_hits": self.turn_cache.hits,
+            "turn_cache_misses": self.turn_cache.misses,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "failures": self.failures,
+            "overloads": self.overloads,
+            "pending_calls": len(self._pending_calls),
+        }
+        if self.utterance_cache is not None:
+            for key, value in self.utterance_cache.stats().items():
+                stats[f"utterance_cache_{key}"] = value
+        return stats
+
     async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
-        return await self._recognizer.recognize(turn_context)
+        # The middleware and the dialogs both ask for the same activity:
+        # only the first call of the turn reaches LUIS.
+        recognizer_result = self.turn_cache.get(turn_context)
+        if recognizer_result is None:
+            recognizer_result = await self._recognize_utterance(turn_context)
+            self.turn_cache.set(turn_context, recognizer_result)
+        return recognizer_result
+
+    async def _recognize_utterance(self, turn_context: TurnContext) -> RecognizerResult:
+        text = turn_context.activity.text
+        use_cache = self.utterance_cache is not None and text and not text.isspace()
+
+        if use_cache:
+            recognizer_result = self.utterance_cache.get(text)
+            if recognizer_result is not None:
+                await self._emit_cached(turn_context, recognizer_result)
+                return recognizer_result
+
+        if self._executor is None:
+            recognizer_result = await self._recognizer.recognize(turn_context)
+        else:
+            recognizer_result = await self._recognize_bounded(turn_context)
+            if recognizer_result is None:
+                # Degraded results are not worth caching across conversations.
+                return await self._recognize_fallback(turn_context)
+
+        if use_cache:
+            self.utterance_cache.set(text, recognizer_result)
+        return recognizer_result
+
+    async def _emit_cached(
+        self, turn_context: TurnContext, recognizer_result: RecognizerResult
+    ) -> None:
+        """
+        Sends the LuisResult event and the LUIS trace of a LUIS call for a result
+        served from the utterance cache, marked as cached.
+        """
+        self._recognizer.on_recognizer_result(
+            recognizer_result, turn_context, {"cached": "true"}
+        )
+        trace_info = {
+            "recognizerResult": LuisUtil.recognizer_result_as_dict(recognizer_result),
+            "luisModel": {"ModelID": self._recognizer._application.application_id},
+            "luisOptions": {"Staging": self._recognizer._options.staging},
+            "cached": True,
+        }
+        await turn_context.send_activity(
+            ActivityUtil.create_trace(
+                turn_context.activity,
+                "LuisRecognizer",
+                trace_info,
+                LuisRecognizer.luis_trace_type,
+                LuisRecognizer.luis_trace_label,
+            )
+        )
+
+    def _current_hedge_delay(self) -> float:
+        """
+        Delay after which a second LUIS request is fired, None to not hedge.
+        """
+        if not self.hedging:
+            return None
+        if self.hedge_delay:
+            return self.hedge_delay
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+
+        latencies = sorted(self._latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def _start_call(self, turn_context: TurnContext):
+        """
+        Submits a LUIS call to the executor and returns its future; returns
+        (None, None) when 'max_pending' calls are submitted and not finished.
+        """
+        # Calls finish on the worker threads: the finished ones are pruned here.
+        self._pending_calls = {call for call in self._pending_calls if not call.done()}
+        if len(self._pending_calls) >= self.max_pending:
+            return None, None
+
+        adapter = RecordingAdapter()
+        detached_context = TurnContext(adapter, turn_context.activity)
+        call = self._executor.submit(
+            _run_in_thread, self._recognizer.recognize, detached_context
+        )
+        self._pending_calls.add(call)
+        return call, adapter
+
+    async def _recognize_bounded(self, turn_context: TurnContext) -> RecognizerResult:
+        """
+        Calls LUIS within the latency budget, hedging the request past the p95
+        delay. Returns None when the budget is exceeded, every call failed or too
+        many calls are pending. On return, the calls that did not start yet are
+        cancelled; the running ones are abandoned.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.timeout if self.timeout else None
+        hedge_delay = self._current_hedge_delay()
+        hedge_at = started + hedge_delay if hedge_delay is not None else None
+        if hedge_at is not None and deadline is not None and hedge_at >= deadline:
+            hedge_at = None
+
+        call, adapter = self._start_call(turn_context)
+        if call is None:
+            self.overloads += 1
+            self._telemetry_client.track_event(
+                "LuisOverload", {"pending": str(len(self._pending_calls))}
+            )
+            return None
+        future = asyncio.wrap_future(call)
+        calls = {future: (call, adapter)}
+        pending = {future}
+
+        try:
+            while pending:
+                wake_ups = [time for time in (deadline, hedge_at) if time is not None]
+                timeout = max(0.0, min(wake_ups) - loop.time()) if wake_ups else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for finished in done:
+                    if finished.exception() is None:
+                        self._latencies.append(loop.time() - started)
+                        recorded = calls[finished][1].activities
+                        if recorded:
+                            await turn_context.send_activities(recorded)
+                        return finished.result()
+                    self.failures += 1
+                    self._telemetry_client.track_event(
+                        "LuisFailure", {"error": str(finished.exception())}
+                    )
+
+                if hedge_at is not None and loop.time() >= hedge_at and pending:
+                    hedge_at = None
+                    call, adapter = self._start_call(turn_context)
+                    # No hedge when too many calls are pending.
+                    if call is not None:
+                        self.hedges += 1
+                        self._telemetry_client.track_event(
+                            "LuisHedge", {"delay": str(hedge_delay)}
+                        )
+                        future = asyncio.wrap_future(call)
+                        calls[future] = (call, adapter)
+                        pending.add(future)
+                elif deadline is not None and loop.time() >= deadline:
+                    self.timeouts += 1
+                    self._telemetry_client.track_event(
+                        "LuisTimeout", {"timeout": str(self.timeout)}
+                    )
+                    return None
+
+            return None
+        finally:
+            for future in pending:
+                # Cancels the call when it is still queued behind the workers.
+                calls[future][0].cancel()
+                future.add_done_callback(_discard)
+
+    async def _recognize_fallback(self, turn_context: TurnContext) -> RecognizerResult:
+        if self.fallback_recognizer is not None and self.fallback_recognizer.is_configured:
+            return await self.fallback_recognizer.recognize(turn_context)
+
+        return RecognizerResult(
+            text=turn_context.activity.text,
+            intents={"None": IntentScore(score=1.0)},
+            entities={"$instance": {}},
+        )
@@ -2,10 +2,48 @@
 # Licensed under the MIT License.
 
 from .luis_helper import Intent, LuisHelper
-from .dialog_helper import DialogHelper
+from .activity_parser import ActivityParser
+from .admission_control import AdmissionControl
+from .card_registry import CardRegistry
+from .conversation_locks import ConversationLocks
+from .dialog_helper import DialogRuntime
+from .http_session import SharedHttpSession
+from .lazy_component import LazyComponent, LazyRecognizer, LazyTelemetryClient
+from .log_helper import LogHelper
+from .luis_evaluation import EvaluationReport, RecordedRecognizer
+from .recording_adapter import RecordingAdapter
+from .state_write_coordinator import StateWriteCoordinator
+from .telemetry_channel import BufferedTelemetryQueue, FileTelemetrySender
+from .timex_cache import TimexCache
+from .transcript_exporter import TranscriptExporter
+from .turn_metrics import TurnMetrics
+from .turn_recognition_cache import TurnRecognitionCache
+from .utterance_cache import UtteranceCache
+from .worker_supervisor import WorkerSupervisor
 
 __all__ = [
-    "DialogHelper",
+    "ActivityParser",
+    "AdmissionControl",
+    "BufferedTelemetryQueue",
+    "CardRegistry",
+    "ConversationLocks",
+    "DialogRuntime",
+    "EvaluationReport",
+    "FileTelemetrySender",
+    "LazyComponent",
+    "LazyRecognizer",
+    "LazyTelemetryClient",
     "LuisHelper",
-    "Intent"
+    "Intent",
+    "LogHelper",
+    "RecordedRecognizer",
+    "RecordingAdapter",
+    "SharedHttpSession",
+    "StateWriteCoordinator",
+    "TimexCache",
+    "TranscriptExporter",
+    "TurnMetrics",
+    "TurnRecognitionCache",
+    "UtteranceCache",
+    "WorkerSupervisor",
 ]
@@ -0,0 +1,146 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Parsing of the activities received on /api/messages.
+Run "python -m helpers.activity_parser" to compare its cost with the generic path.
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+from botbuilder.schema import Activity, ChannelAccount, ConversationAccount
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_BASIC_TYPES = {"str": str, "bool": bool}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _field_map(model) -> dict:
+    # JSON key -> (attribute, msrest type)
+    return {spec["key"]: (attr, spec["type"]) for attr, spec in model._attribute_map.items()}
+
+
+_ACTIVITY_FIELDS = _field_map(Activity)
+_ACCOUNT_MODELS = {
+    "ChannelAccount": (ChannelAccount, _field_map(ChannelAccount)),
+    "ConversationAccount": (ConversationAccount, _field_map(ConversationAccount)),
+}
+
+
+def _parse_datetime(value: str) -> datetime:
+    try:
+        # Python < 3.11 rejects "Z" and more than 6 digits of fraction.
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        raise _Unsupported()
+
+
+def _parse_value(value, value_type: str):
+    if value is None or value_type == "object":
+        return value
+
+    basic_type = _BASIC_TYPES.get(value_type)
+    if basic_type is not None:
+        if not isinstance(value, basic_type):
+            raise _Unsupported()
+        return value
+
+    if value_type == "iso-8601":
+        return _parse_datetime(value)
+
+    if value_type.startswith("["):
+        if not isinstance(value, list):
+            raise _Unsupported()
+        return [_parse_value(item, value_type[1:-1]) for item in value]
+
+    model = _ACCOUNT_MODELS.get(value_type)
+    if model is None or not isinstance(value, dict):
+        raise _Unsupported()
+    return _parse_model(value, *model)
+
+
+def _parse_model(body: dict, model, fields: dict):
+    kwargs = {}
+    for key, value in body.items():
+        field = fields.get(key)
+        # Unknown keys are ignored, as by the msrest deserializer.
+        if field is not None:
+            kwargs[field[0]] = _parse_value(value, field[1])
+    return model(**kwargs)
+
+
+class ActivityParser:
+    """
+    Decodes the request bodies with orjson when it is installed, and builds the
+    activities directly from their fields. The activities with fields of other
+    types than text, dates, accounts and free objects (e.g. attachments or
+    entities) go through the generic msrest deserializer.
+    """
+
+    fast_json = orjson is not None
+
+    @staticmethod
+    def loads(data: bytes) -> dict:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    @staticmethod
+    def parse(body: dict) -> Activity:
+        if not isinstance(body, dict):
+            raise ValueError("[ActivityParser]: The activity must be a JSON object")
+        try:
+            return _parse_model(body, Activity, _ACTIVITY_FIELDS)
+        except _Unsupported:
+            return Activity().deserialize(body)
+
+
+SAMPLE_ACTIVITY = {
+    "type": "message",
+    "id": "4fcd1a7b-0c7c-4b6a-9a35-2a8a4c1e7a3f|0000001",
+    "timestamp": "2021-03-23T10:12:31.5581232Z",
+    "localTimestamp": "2021-03-23T11:12:31.558+01:00",
+    "localTimezone": "Europe/Paris",
+    "serviceUrl": "https://webchat.botframework.com/",
+    "channelId": "webchat",
+    "from": {"id": "dl_8b1c4e", "name": "User"},
+    "conversation": {"id": "FmyfB6ZLgmv7xc1SQmTwP2-fr"},
+    "recipient": {"id": "p10-bot@ghWwbDrNpJk", "name": "p10-bot"},
+    "textFormat": "plain",
+    "locale": "en-US",
+    "text": "I'd like to book a flight from Paris to Berlin on march 23",
+    "channelData": {"clientActivityID": "1616494351371r1ycsycpwt"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    data = json.dumps(SAMPLE_ACTIVITY).encode("utf-8")
+
+    def generic():
+        Activity().deserialize(json.loads(data))
+
+    def lean():
+        ActivityParser.parse(ActivityParser.loads(data))
+
+    print(f"orjson: {'yes' if ActivityParser.fast_json else 'no'}")
+    for name, function in (("generic", generic), ("lean", lean)):
+        seconds = min(timeit.repeat(function, number=args.number, repeat=3))
+        print(f"{name:>8}: {seconds / args.number * 1e6:8.1f} us per activity")
+
+
+if __name__ == "__main__":
+    main()
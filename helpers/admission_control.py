@@ -0,0 +1,110 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+from http import HTTPStatus
+from typing import Iterable
+
+from aiohttp import web
+
+from .log_helper import LogHelper
+
+LOGGER = LogHelper.get_logger("admission")
+
+
+class AdmissionControl:
+    """
+    aiohttp middleware bounding the turns processed at once. Past 'max_in_flight',
+    a request waits in a queue of 'max_queue' requests for at most 'queue_timeout'
+    seconds; it is answered 429 when the queue is full and 503 when its wait times
+    out, both with a Retry-After header, so that bursts are shed quickly instead
+    of slowing every turn down. Used as a middleware, only the requests to
+    'paths' are counted; run() admits a request from within its handler.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 64,
+        max_queue: int = 128,
+        queue_timeout: float = 2.0,
+        retry_after: int = 1,
+        paths: Iterable[str] = ("/api/messages",),
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.paths = frozenset(paths)
+        # Created on the first request, in the loop of the application.
+        self._slots = None
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
+
+    def _shed(self, status: HTTPStatus, reason: str) -> web.Response:
+        LOGGER.info(
+            "Request shed",
+            extra={"fields": {"reason": reason, "in_flight": self.in_flight, "waiting": self.waiting}},
+        )
+        return web.Response(status=status, headers={"Retry-After": str(self.retry_after)})
+
+    async def _acquire(self) -> web.Response:
+        # Returns the response shedding the request, or None once it is admitted.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return None
+
+        if self.waiting >= self.max_queue:
+            self.shed_queue_full += 1
+            return self._shed(HTTPStatus.TOO_MANY_REQUESTS, "queue full")
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed_timeout += 1
+            return self._shed(HTTPStatus.SERVICE_UNAVAILABLE, "queue timeout")
+        finally:
+            self.waiting -= 1
+        return None
+
+    async def run(self, handler, *args) -> web.StreamResponse:
+        """
+        Returns the response of 'handler' once the request is admitted, or the
+        response shedding it.
+        """
+        shed_response = await self._acquire()
+        if shed_response is not None:
+            return shed_response
+
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            return await handler(*args)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path not in self.paths:
+            return await handler(request)
+        return await self.run(handler, request)
@@ -0,0 +1,86 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import glob
+import json
+import os
+import time
+from typing import Callable
+
+from botbuilder.schema import Attachment
+
+CARDS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cards"
+)
+ADAPTIVE_CARD_CONTENT_TYPE = "application/vnd.microsoft.card.adaptive"
+
+
+class _CardEntry:
+    __slots__ = ("attachment", "mtime", "checked_at")
+
+    def __init__(self, attachment: Attachment, mtime: int, checked_at: float):
+        self.attachment = attachment
+        self.mtime = mtime
+        self.checked_at = checked_at
+
+
+class CardRegistry:
+    """
+    Adaptive cards of the cards directory, loaded once and kept as ready-made
+    attachments. The attachments are shared by every conversation and must not
+    be modified. The cards are kept parsed: the connector client serializes the
+    whole activity, attachments included, when it is sent. A card file is
+    stat'ed at most every 'reload_interval' seconds and reloaded when its
+    modification time changes (None disables reloading).
+    """
+
+    def __init__(
+        self,
+        directory: str = CARDS_DIRECTORY,
+        reload_interval: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._cards = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _load(self, name: str, mtime: int) -> _CardEntry:
+        with open(self._path(name)) as card_file:
+            card = json.load(card_file)
+
+        attachment = Attachment(content_type=ADAPTIVE_CARD_CONTENT_TYPE, content=card)
+        entry = _CardEntry(attachment, mtime, self._clock())
+        self._cards[name] = entry
+        return entry
+
+    def get(self, name: str) -> Attachment:
+        """
+        Returns the attachment of cards/<name>.json.
+        """
+        entry = self._cards.get(name)
+        if entry is None:
+            return self._load(name, os.stat(self._path(name)).st_mtime_ns).attachment
+
+        now = self._clock()
+        if self.reload_interval is not None and now - entry.checked_at >= self.reload_interval:
+            mtime = os.stat(self._path(name)).st_mtime_ns
+            if mtime != entry.mtime:
+                return self._load(name, mtime).attachment
+            entry.checked_at = now
+
+        return entry.attachment
+
+    def preload(self) -> None:
+        """
+        Loads every card of the directory, so that no turn reads from disk.
+        """
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            self._load(name, os.stat(path).st_mtime_ns)
+
+    def clear(self) -> None:
+        self._cards.clear()
@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class _LockEntry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Turns holding or waiting for the lock.
+        self.users = 0
+
+
+class ConversationLocks:
+    """
+    Orders the turns of a conversation: a turn waits for the previous turns of
+    its conversation (first come, first served), while the turns of different
+    conversations run concurrently. A lock is dropped as soon as no turn holds
+    or waits for it, so only the conversations with a turn in progress use memory.
+    With several workers, 'leases' (storage.ConversationLeases) orders the turns
+    across the processes: a turn takes the lease of its conversation once it
+    holds the lock of its process.
+    """
+
+    def __init__(self, leases=None):
+        self._locks = {}
+        self._leases = leases
+        self.contended = 0
+        self.max_waiting = 0
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def stats(self) -> dict:
+        stats = {
+            "active": len(self._locks),
+            "contended": self.contended,
+            "max_waiting": self.max_waiting,
+        }
+        if self._leases is not None:
+            stats.update({f"lease_{name}": value for name, value in self._leases.stats().items()})
+        return stats
+
+    @asynccontextmanager
+    async def hold(self, conversation_id: str):
+        if not conversation_id:
+            yield
+            return
+
+        entry = self._locks.get(conversation_id)
+        if entry is None:
+            entry = self._locks[conversation_id] = _LockEntry()
+        entry.users += 1
+        if entry.users > 1:
+            self.contended += 1
+            self.max_waiting = max(self.max_waiting, entry.users - 1)
+
+        try:
+            async with entry.lock:
+                if self._leases is None:
+                    yield
+                else:
+                    await self._leases.acquire(conversation_id)
+                    try:
+                        yield
+                    finally:
+                        await self._leases.release(conversation_id)
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[conversation_id]
@@ -0,0 +1,273 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Benchmark of the dialogs: drives BookingDialog, DateResolverDialog and MainDialog
+through DialogTestClient, with a recorded recognizer instead of LUIS, and times
+each turn, each waterfall step and each full flow. The allocations of each turn
+are measured in a separate pass, under tracemalloc.
+
+    python -m helpers.dialog_benchmark --repeat 50 --output results.json
+    python -m helpers.dialog_benchmark --baseline results.json --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple
+
+from botbuilder.core import ConversationState, MemoryStorage, NullTelemetryClient, UserState
+from botbuilder.testing.dialog_test_client import DialogTestClient
+
+from .luis_evaluation import RecordedRecognizer, percentile
+from .turn_metrics import instrument_waterfalls
+
+BOOKING_TURNS = ("hi", "Berlin", "Paris", "mar 23", "mar 23 2021", "apr 15 2021", "$500", "yes")
+BOOKING_WITH_DETAILS_TURNS = ("hi", "Paris", "apr 15 2021", "$500", "yes")
+DATE_RESOLVER_TURNS = ("hi", "mar 23", "mar 23 2021")
+MAIN_TURNS = (
+    "hi",
+    "book a flight from paris to berlin",
+    "mar 23 2021",
+    "apr 15 2021",
+    "$500",
+    "yes",
+)
+
+# Recognizer results of MainDialog, in the LUIS trace format (see RecordedRecognizer).
+RECORDINGS = [
+    {
+        "text": "book a flight from paris to berlin",
+        "intents": {"inform": {"score": 0.95}, "None": {"score": 0.05}},
+        "entities": {
+            "$instance": {
+                "or_city": [{"text": "paris", "startIndex": 19, "endIndex": 24, "score": 0.99}],
+                "dst_city": [{"text": "berlin", "startIndex": 28, "endIndex": 34, "score": 0.99}],
+            },
+        },
+    },
+]
+
+
+class Scenario(NamedTuple):
+    name: str
+    # Returns the dialog under test and the options it is started with.
+    build: Callable[[], tuple]
+    turns: tuple
+
+
+def _booking_details(**values):
+    from booking_details import BookingDetails  # pylint: disable=import-outside-toplevel
+
+    details = BookingDetails()
+    for name, value in values.items():
+        setattr(details, name, value)
+    return details
+
+
+def _booking_dialog():
+    from dialogs import BookingDialog  # pylint: disable=import-outside-toplevel
+
+    storage = MemoryStorage()
+    return BookingDialog(
+        user_state=UserState(storage),
+        con_state=ConversationState(storage),
+        telemetry_client=NullTelemetryClient(),
+    )
+
+
+def build_scenarios() -> List[Scenario]:
+    """
+    Each scenario has dialogs of its own, so that their steps are timed apart.
+    """
+    # The dialogs import the helpers, they are imported once the package is loaded.
+    from dialogs import DateResolverDialog, MainDialog  # pylint: disable=import-outside-toplevel
+
+    booking_dialog = _booking_dialog()
+    details_booking_dialog = _booking_dialog()
+    date_resolver_dialog = DateResolverDialog(telemetry_client=NullTelemetryClient())
+    main_dialog = MainDialog(RecordedRecognizer(RECORDINGS), _booking_dialog())
+    return [
+        Scenario("booking", lambda: (booking_dialog, _booking_details()), BOOKING_TURNS),
+        Scenario(
+            "booking_with_details",
+            lambda: (
+                details_booking_dialog,
+                _booking_details(destination="Berlin", travel_start_date="2021-03-23"),
+            ),
+            BOOKING_WITH_DETAILS_TURNS,
+        ),
+        Scenario(
+            "date_resolver",
+            lambda: (date_resolver_dialog, {"date": None, "direction": "in"}),
+            DATE_RESOLVER_TURNS,
+        ),
+        Scenario("main", lambda: (main_dialog, None), MAIN_TURNS),
+    ]
+
+
+async def _run_flow(scenario: Scenario, on_turn: Callable = None) -> float:
+    dialog, options = scenario.build()
+    client = DialogTestClient("benchmark", dialog, options)
+    start = time.perf_counter()
+    for index, text in enumerate(scenario.turns):
+        turn_start = time.perf_counter()
+        await client.send_activity(text)
+        if on_turn is not None:
+            on_turn(index, time.perf_counter() - turn_start)
+    return time.perf_counter() - start
+
+
+def _summary(seconds: List[float]) -> dict:
+    values = sorted(seconds)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+    }
+
+
+async def run_scenario(scenario: Scenario, repeat: int = 20, warmup: int = 2) -> dict:
+    """
+    Times 'repeat' runs of the scenario after 'warmup' runs (these load the date
+    recognizers and fill the caches), then measures the allocations of one run.
+    """
+    step_timings = defaultdict(list)
+    instrument_waterfalls(
+        scenario.build()[0], lambda step, seconds: step_timings[step].append(seconds)
+    )
+    for _ in range(warmup):
+        await _run_flow(scenario)
+    step_timings.clear()
+
+    flows = []
+    turns = [[] for _ in scenario.turns]
+    for _ in range(repeat):
+        # Garbage of the previous runs is not collected during this one.
+        gc.collect()
+        flows.append(
+            await _run_flow(scenario, lambda index, seconds: turns[index].append(seconds))
+        )
+    steps = {name: _summary(seconds) for name, seconds in sorted(step_timings.items())}
+
+    # tracemalloc slows everything down: the allocations are measured apart.
+    allocations = []
+    traced = 0
+
+    def measure(index, _):
+        nonlocal traced
+        current, peak = tracemalloc.get_traced_memory()
+        allocations.append({
+            "alloc_peak_kb": round((peak - traced) / 1024, 1),
+            "alloc_net_kb": round((current - traced) / 1024, 1),
+        })
+        tracemalloc.reset_peak()
+        traced = current
+
+    tracemalloc.start()
+    try:
+        traced = tracemalloc.get_traced_memory()[0]
+        await _run_flow(scenario, measure)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "flow": _summary(flows),
+        "turns": [
+            dict(text=text, **_summary(seconds), **allocation)
+            for text, seconds, allocation in zip(scenario.turns, turns, allocations)
+        ],
+        "steps": steps,
+    }
+
+
+async def run_benchmark(scenarios: List[Scenario], repeat: int = 20, warmup: int = 2) -> dict:
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "scenarios": {},
+    }
+    for scenario in scenarios:
+        results["scenarios"][scenario.name] = await run_scenario(scenario, repeat, warmup)
+    return results
+
+
+def _metrics(results: dict) -> Dict[str, float]:
+    metrics = {}
+    for name, scenario in results["scenarios"].items():
+        metrics[f"{name} flow"] = scenario["flow"]["p50_ms"]
+        for index, turn in enumerate(scenario["turns"]):
+            metrics[f"{name} turn {index} ({turn['text']})"] = turn["p50_ms"]
+        for step, timing in scenario["steps"].items():
+            metrics[f"{name} {step}"] = timing["p50_ms"]
+    return metrics
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> List[dict]:
+    """
+    Compares the median durations of the results with those of a baseline; a
+    metric regresses when it is more than 'threshold' (a fraction) slower.
+    """
+    baseline_metrics = _metrics(baseline)
+    rows = []
+    for metric, value in _metrics(results).items():
+        reference = baseline_metrics.get(metric)
+        if not reference:
+            continue
+        ratio = value / reference
+        rows.append({
+            "metric": metric,
+            "baseline_ms": reference,
+            "current_ms": value,
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs of each scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs of each scenario")
+    parser.add_argument("--scenario", action="append", help="scenario to run (default: all)")
+    parser.add_argument("--output", help="file where the JSON results are written")
+    parser.add_argument("--baseline", help="JSON results the run is compared with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    scenarios = [
+        scenario for scenario in build_scenarios()
+        if not args.scenario or scenario.name in args.scenario
+    ]
+    results = asyncio.run(run_benchmark(scenarios, args.repeat, args.warmup))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+
+    if not args.baseline:
+        print(output)
+        return
+
+    with open(args.baseline) as baseline_file:
+        rows = compare(results, json.load(baseline_file), args.threshold)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['metric']:<60} {row['baseline_ms']:>9.3f} {row['current_ms']:>9.3f}"
+            f" {row['ratio']:>6.2f}x{flag}"
+        )
+    if any(row["regression"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
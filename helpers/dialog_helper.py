@@ -1,19 +1,27 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
-from botbuilder.core import StatePropertyAccessor, TurnContext
+from botbuilder.core import ConversationState, TurnContext
 from botbuilder.dialogs import Dialog, DialogSet, DialogTurnStatus
 
+from .turn_metrics import TurnMetrics
 
-class DialogHelper:
-    @staticmethod
-    async def run_dialog(
-        dialog: Dialog, turn_context: TurnContext, accessor: StatePropertyAccessor
-    ):
-        dialog_set = DialogSet(accessor)
-        dialog_set.add(dialog)
 
-        dialog_context = await dialog_set.create_context(turn_context)
-        results = await dialog_context.continue_dialog()
-        if results.status == DialogTurnStatus.Empty:
-            await dialog_context.begin_dialog(dialog.id)
+class DialogRuntime:
+    """
+    Dialog set and dialog state accessor built once at startup and shared by
+    every turn, which then only has to create its DialogContext.
+    """
+
+    def __init__(self, dialog: Dialog, conversation_state: ConversationState):
+        self.dialog = dialog
+        self.accessor = conversation_state.create_property("DialogState")
+        self.dialog_set = DialogSet(self.accessor)
+        self.dialog_set.add(dialog)
+
+    async def run(self, turn_context: TurnContext):
+        with TurnMetrics.span("dialog.run"):
+            dialog_context = await self.dialog_set.create_context(turn_context)
+            results = await dialog_context.continue_dialog()
+            if results.status == DialogTurnStatus.Empty:
+                await dialog_context.begin_dialog(self.dialog.id)
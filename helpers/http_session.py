@@ -0,0 +1,58 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import requests
+from msrest import Configuration
+from msrest.universal_http.requests import ClientRetryPolicy
+
+HTTP_PROTOCOLS = ("http://", "https://")
+
+
+class SharedHttpSession:
+    """
+    One keep-alive connection pool per worker, shared by the msrest clients of the
+    bot (the LUIS runtime and the Bot Connector clients), so that their TLS
+    connections are reused across turns instead of opened per client or per call.
+    The pool is mounted on the session each client sends its requests on, which
+    msrest signs with the client's credentials (LUIS key, Bot Connector token).
+    'pool_size' connections are kept per host; with 'pool_block', no more than
+    that are opened at once and the requests wait for a free one.
+    """
+
+    def __init__(self, pool_size: int = 20, pool_block: bool = False):
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.requests = 0
+
+        self.adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            # The retries msrest would have configured on its own sessions.
+            max_retries=ClientRetryPolicy()(),
+        )
+
+    def attach(self, config: Configuration) -> None:
+        """
+        Makes the msrest client using this configuration send its requests on the shared pool.
+        """
+        config.session_configuration_callback = self._use_pool
+
+    def _use_pool(self, session, global_config, local_config, **kwargs) -> dict:
+        # 'session' is the signed session of the client (one per thread): only
+        # its connection pool is replaced, never its headers or authentication.
+        self.requests += 1
+        for protocol in HTTP_PROTOCOLS:
+            if session.get_adapter(protocol) is not self.adapter:
+                session.mount(protocol, self.adapter)
+        return kwargs
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "pool_size": self.pool_size}
+
+    def close(self) -> None:
+        self.adapter.close()
+
+    # aiohttp signal handler.
+    async def on_cleanup(self, app) -> None:
+        self.close()
@@ -0,0 +1,163 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import threading
+import time
+from typing import Callable, Dict
+
+from botbuilder.core import BotTelemetryClient, Recognizer, RecognizerResult, TurnContext
+from botbuilder.core.bot_telemetry_client import Severity, TelemetryDataPointType
+
+from .log_helper import LogHelper
+
+LOGGER = LogHelper.get_logger("startup")
+
+
+class LazyComponent:
+    """
+    Builds a component with 'factory' on its first use, or in an aiohttp startup
+    hook, instead of when app.py is imported. The factory imports the modules of
+    the component, so that they are not loaded when the component is never used.
+    The component is built once, also when threads ask for it at the same time.
+    """
+
+    def __init__(self, factory: Callable[[], object], name: str):
+        self._factory = factory
+        self.name = name
+        self._instance = None
+        self._lock = threading.Lock()
+        self.build_time = None
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> object:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    instance = self._factory()
+                    self.build_time = time.perf_counter() - start
+                    LOGGER.info(
+                        "Component built",
+                        extra={"fields": {"component": self.name, "seconds": round(self.build_time, 3)}},
+                    )
+                    self._instance = instance
+        return self._instance
+
+    # aiohttp signal handler: built before the first turn is served.
+    async def on_startup(self, app) -> None:
+        self.get()
+
+
+class LazyRecognizer(LazyComponent, Recognizer):
+    """
+    Recognizer built on its first use; its other attributes (stats, caches) are
+    those of the built recognizer.
+    """
+
+    @property
+    def is_configured(self) -> bool:
+        return self.get().is_configured
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        return await self.get().recognize(turn_context)
+
+    def __getattr__(self, name: str):
+        # Only called for the attributes this proxy does not have.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+class LazyTelemetryClient(LazyComponent, BotTelemetryClient):
+    """
+    Telemetry client built on its first use, so that the dialogs can be given it
+    before the Application Insights modules are loaded.
+    """
+
+    def track_pageview(
+        self,
+        name: str,
+        url: str,
+        duration: int = 0,
+        properties: Dict[str, object] = None,
+        measurements: Dict[str, object] = None,
+    ) -> None:
+        self.get().track_pageview(name, url, duration, properties, measurements)
+
+    def track_exception(
+        self,
+        exception_type: type = None,
+        value: Exception = None,
+        trace: object = None,
+        properties: Dict[str, object] = None,
+        measurements: Dict[str, object] = None,
+    ) -> None:
+        self.get().track_exception(exception_type, value, trace, properties, measurements)
+
+    def track_event(
+        self,
+        name: str,
+        properties: Dict[str, object] = None,
+        measurements: Dict[str, object] = None,
+    ) -> None:
+        self.get().track_event(name, properties, measurements)
+
+    def track_metric(
+        self,
+        name: str,
+        value: float,
+        tel_type: TelemetryDataPointType = None,
+        count: int = None,
+        min_val: float = None,
+        max_val: float = None,
+        std_dev: float = None,
+        properties: Dict[str, object] = None,
+    ) -> None:
+        self.get().track_metric(name, value, tel_type, count, min_val, max_val, std_dev, properties)
+
+    def track_trace(self, name: str, properties: Dict[str, object] = None, severity: Severity = None):
+        self.get().track_trace(name, properties, severity)
+
+    def track_request(
+        self,
+        name: str,
+        url: str,
+        success: bool,
+        start_time: str = None,
+        duration: int = None,
+        response_code: str = None,
+        http_method: str = None,
+        properties: Dict[str, object] = None,
+        measurements: Dict[str, object] = None,
+        request_id: str = None,
+    ):
+        self.get().track_request(
+            name, url, success, start_time, duration, response_code,
+            http_method, properties, measurements, request_id,
+        )
+
+    def track_dependency(
+        self,
+        name: str,
+        data: str,
+        type_name: str = None,
+        target: str = None,
+        duration: int = None,
+        success: bool = None,
+        result_code: str = None,
+        properties: Dict[str, object] = None,
+        measurements: Dict[str, object] = None,
+        dependency_id: str = None,
+    ):
+        self.get().track_dependency(
+            name, data, type_name, target, duration, success,
+            result_code, properties, measurements, dependency_id,
+        )
+
+    def flush(self):
+        # Nothing was tracked yet when the client was never built.
+        if self.built:
+            self.get().flush()
@@ -0,0 +1,379 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Load test of the bot: replays the user turns of the Frames conversations against
+the aiohttp application of app.py, with LUIS and the Bot Connector replaced by
+local fakes running on a thread of this process.
+
+    python -m helpers.load_test frames.json --concurrency 20 --duration 60
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from .luis_evaluation import percentile
+
+FAKE_LUIS_APP_ID = "00000000-0000-0000-0000-000000000001"
+FAKE_LUIS_KEY = "00000000000000000000000000000001"
+FRAMES_ENTITIES = ("or_city", "dst_city", "str_date", "end_date", "budget")
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def load_conversations(path: str, limit: int = None) -> List[List[dict]]:
+    """
+    Returns the user turns (text and labels) of the Frames conversations.
+    """
+    with open(path) as frames_file:
+        dialogs = json.load(frames_file)
+
+    conversations = []
+    for dialog in dialogs[:limit]:
+        turns = [turn for turn in dialog["turns"] if turn["author"] == "user" and turn["text"]]
+        if turns:
+            conversations.append(turns)
+    return conversations
+
+
+def prediction_from_labels(turn: dict) -> dict:
+    """
+    LUIS v2 response built from the labels of a Frames user turn.
+    """
+    text = turn["text"]
+    entities = []
+    acts = turn.get("labels", {}).get("acts", [])
+    for act in acts:
+        for arg in act.get("args", []):
+            value = arg.get("val")
+            if arg.get("key") not in FRAMES_ENTITIES or not isinstance(value, str):
+                continue
+            start = text.lower().find(value.lower())
+            if start < 0:
+                continue
+            entities.append({
+                "entity": value.lower(),
+                "type": arg["key"],
+                "startIndex": start,
+                "endIndex": start + len(value) - 1,
+                "score": 1.0,
+            })
+
+    intent = "inform" if any(act.get("name") == "inform" for act in acts) else "None"
+    other = "None" if intent == "inform" else "inform"
+    return {
+        "query": text,
+        "topScoringIntent": {"intent": intent, "score": 0.9},
+        "intents": [{"intent": intent, "score": 0.9}, {"intent": other, "score": 0.1}],
+        "entities": entities,
+    }
+
+
+def prediction_from_recording(recording: dict) -> dict:
+    """
+    LUIS v2 response built from a recorded result (see RecordedRecognizer).
+    """
+    intents = sorted(
+        ({"intent": name, "score": value["score"]} for name, value in recording["intents"].items()),
+        key=lambda intent: intent["score"],
+        reverse=True,
+    )
+    entities = []
+    for entity_type, instances in recording.get("entities", {}).get("$instance", {}).items():
+        for instance in instances:
+            entities.append({
+                "entity": instance.get("text", ""),
+                "type": entity_type,
+                "startIndex": instance["startIndex"],
+                # Inclusive in the v2 responses.
+                "endIndex": instance["endIndex"] - 1,
+                "score": instance.get("score", 1.0),
+            })
+    return {
+        "query": recording["text"],
+        "topScoringIntent": intents[0] if intents else {"intent": "None", "score": 1.0},
+        "intents": intents,
+        "entities": entities,
+    }
+
+
+class FakeServices:
+    """
+    Fake LUIS endpoint answering the given predictions (keyed on the utterance)
+    and fake Bot Connector absorbing the replies, served on a thread of their own:
+    the LUIS client blocks the event loop of the bot while it waits. Like LUIS,
+    the fake answers 401 to the requests without 'luis_key'.
+    """
+
+    def __init__(self, predictions: Dict[str, dict], port: int = 0, luis_key: str = FAKE_LUIS_KEY):
+        self.predictions = predictions
+        self.port = port
+        self.luis_key = luis_key
+        self.luis_calls = 0
+        self.luis_rejected = 0
+        self.replies = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _luis(self, request: web.Request) -> web.Response:
+        self.luis_calls += 1
+        if request.headers.get("Ocp-Apim-Subscription-Key") != self.luis_key:
+            self.luis_rejected += 1
+            return web.json_response({"error": {"code": "401"}}, status=401)
+        query = request.query.get("q")
+        if query is None:
+            # The runtime client posts the utterance as a JSON string.
+            query = await request.json() if request.can_read_body else ""
+        prediction = self.predictions.get(query) or {
+            "query": query,
+            "topScoringIntent": {"intent": "None", "score": 1.0},
+            "intents": [{"intent": "None", "score": 1.0}],
+            "entities": [],
+        }
+        return web.json_response(prediction)
+
+    async def _connector(self, request: web.Request) -> web.Response:
+        self.replies += 1
+        return web.json_response({"id": str(self.replies)})
+
+    async def _start(self, started: threading.Event) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/luis/{tail:.*}", self._luis)
+        app.router.add_route("*", "/v3/{tail:.*}", self._connector)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        started.set()
+
+    def start(self) -> None:
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(started), self._loop)
+        started.wait()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak, not current, resident size (kilobytes on Linux, bytes on macOS).
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoadReport:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.conversations = 0
+        self.memory = []
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def record(self, latency: float, status: int) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+        if status >= 400:
+            self.errors += 1
+
+    def sample_memory(self) -> None:
+        self.memory.append((round(time.perf_counter() - self.started, 1), _rss_bytes()))
+
+    def histogram(self) -> Dict[str, int]:
+        buckets = Counter()
+        for latency in self.latencies:
+            milliseconds = latency * 1000
+            bound = next((b for b in LATENCY_BUCKETS_MS if milliseconds <= b), None)
+            buckets[f"<={bound}ms" if bound else f">{LATENCY_BUCKETS_MS[-1]}ms"] += 1
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {label: buckets[label] for label in labels}
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        turns = len(latencies)
+        memory_mb = [(elapsed, round(rss / 2 ** 20, 1)) for elapsed, rss in self.memory]
+        return {
+            "conversations": self.conversations,
+            "turns": turns,
+            "duration": round(self.duration, 2),
+            "turns_per_second": round(turns / self.duration, 2) if self.duration else 0.0,
+            "error_rate": round(self.errors / turns, 4) if turns else 0.0,
+            "statuses": dict(self.statuses),
+            "latency_ms": {
+                name: round(percentile(latencies, fraction) * 1000, 2)
+                for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+            },
+            "histogram": self.histogram(),
+            "memory_mb": memory_mb,
+            "memory_growth_mb": round(memory_mb[-1][1] - memory_mb[0][1], 1) if memory_mb else 0.0,
+        }
+
+
+def build_activity(conversation_id: str, index: int, service_url: str, text: str = None) -> dict:
+    """
+    Bot Framework activity of a load test conversation, as posted on /api/messages:
+    a message when 'text' is given, otherwise the conversation update opening it.
+    """
+    activity = {
+        "type": "message" if text is not None else "conversationUpdate",
+        "id": f"{conversation_id}-{index}",
+        "channelId": "loadtest",
+        "serviceUrl": service_url,
+        "conversation": {"id": conversation_id},
+        "from": {"id": f"{conversation_id}-user"},
+        "recipient": {"id": "bot"},
+    }
+    if text is None:
+        activity["membersAdded"] = [{"id": f"{conversation_id}-user"}]
+    else:
+        activity["text"] = text
+    return activity
+
+
+async def run_load(
+    app: web.Application,
+    conversations: List[List[dict]],
+    service_url: str,
+    concurrency: int = 10,
+    rate: float = None,
+    duration: float = None,
+    sample_interval: float = 1.0,
+) -> LoadReport:
+    """
+    Replays the conversations with at most 'concurrency' of them at once, started
+    at 'rate' per second when given. The conversations are replayed once, or in
+    a loop for 'duration' seconds.
+    """
+    report = LoadReport()
+    source = itertools.cycle(enumerate(conversations)) if duration else enumerate(conversations)
+    deadline = time.perf_counter() + duration if duration else None
+    slots = asyncio.Semaphore(concurrency)
+
+    async with TestClient(TestServer(app)) as client:
+
+        async def post(activity: dict) -> None:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/messages", json=activity)
+                await response.read()
+                status = response.status
+            except Exception:  # pylint: disable=broad-except
+                status = 599
+            report.record(time.perf_counter() - start, status)
+
+        async def replay(number: int, turns: List[dict]) -> None:
+            conversation_id = f"load-{number}"
+            try:
+                await post(build_activity(conversation_id, 0, service_url))
+                for index, turn in enumerate(turns, start=1):
+                    await post(build_activity(conversation_id, index, service_url, turn["text"]))
+                report.conversations += 1
+            finally:
+                slots.release()
+
+        async def sample() -> None:
+            while True:
+                report.sample_memory()
+                await asyncio.sleep(sample_interval)
+
+        sampler = asyncio.ensure_future(sample())
+        tasks = []
+        number = 0
+        for _, turns in source:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(replay(number, turns)))
+            number += 1
+            if rate:
+                await asyncio.sleep(1.0 / rate)
+        await asyncio.gather(*tasks)
+
+        sampler.cancel()
+        report.sample_memory()
+        report.duration = time.perf_counter() - report.started
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("frames", help="frames.json of the Frames dataset")
+    parser.add_argument("--recordings", help="recorded LUIS predictions (see helpers.luis_evaluation)")
+    parser.add_argument("--conversations", type=int, help="number of Frames conversations used")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, help="conversations started per second")
+    parser.add_argument("--duration", type=float, help="seconds of replay, in a loop")
+    parser.add_argument("--output", help="file where the JSON report is written")
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.frames, args.conversations)
+    predictions = {
+        turn["text"]: prediction_from_labels(turn) for turns in conversations for turn in turns
+    }
+    if args.recordings:
+        with open(args.recordings) as recordings_file:
+            for recording in json.load(recordings_file):
+                predictions[recording["text"]] = prediction_from_recording(recording)
+
+    services = FakeServices(predictions)
+    services.start()
+    try:
+        # The configuration is read when app.py is imported.
+        os.environ["LUIS_APP_ID"] = FAKE_LUIS_APP_ID
+        os.environ["PREDICTION_KEY"] = FAKE_LUIS_KEY
+        os.environ["PREDICTION_ENDPOINT"] = services.url
+        os.environ["RECOGNIZER_BACKEND"] = "luis"
+        import app  # pylint: disable=import-outside-toplevel
+
+        report = asyncio.run(
+            run_load(
+                app.init_func(None),
+                conversations,
+                services.url,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                duration=args.duration,
+            )
+        )
+    finally:
+        services.stop()
+
+    result = report.as_dict()
+    result["luis_calls"] = services.luis_calls
+    result["luis_rejected"] = services.luis_rejected
+    result["replies"] = services.replies
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+ROOT_LOGGER = "bot"
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats a record as a single JSON line. Structured fields are passed with
+    extra={"fields": {...}}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "category": record.name.split(".", 1)[-1],
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class _StructuredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merges the arguments and renders the traceback before the record
+        # leaves the calling thread, but keeps the traceback apart from the message.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records below WARNING, per category.
+    """
+
+    def __init__(self, rates: Dict[str, float] = None):
+        super(SamplingFilter, self).__init__()
+        self.rates = rates or {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name.split(".", 1)[-1], 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LogHelper:
+    _listener = None
+    _exit_handler_registered = False
+
+    @staticmethod
+    def get_logger(category: str) -> logging.Logger:
+        return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+    @staticmethod
+    def parse_sampling(sampling: str) -> Dict[str, float]:
+        """
+        Parses rates written as "luis=0.1,dialogs=0.5".
+        """
+        rates = {}
+        for item in filter(None, (part.strip() for part in sampling.split(","))):
+            category, rate = item.split("=")
+            rates[category.strip()] = float(rate)
+        return rates
+
+    @staticmethod
+    def configure(level: str = "WARNING", sampling: str = "", stream=None) -> None:
+        """
+        Routes the bot loggers to a queue: the records are sampled and queued on
+        the calling coroutine, then formatted and written by a listener thread.
+        """
+        LogHelper.shutdown()
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level.upper())
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        records = queue.SimpleQueue()
+        queue_handler = _StructuredQueueHandler(records)
+        queue_handler.addFilter(SamplingFilter(LogHelper.parse_sampling(sampling)))
+        root.addHandler(queue_handler)
+
+        stream_handler = logging.StreamHandler(stream or sys.stdout)
+        stream_handler.setFormatter(StructuredFormatter())
+        LogHelper._listener = QueueListener(records, stream_handler)
+        LogHelper._listener.start()
+        if not LogHelper._exit_handler_registered:
+            atexit.register(LogHelper.shutdown)
+            LogHelper._exit_handler_registered = True
+
+    @staticmethod
+    def shutdown() -> None:
+        # Flushes the queued records.
+        if LogHelper._listener is not None:
+            LogHelper._listener.stop()
+            LogHelper._listener = None
@@ -0,0 +1,292 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List
+
+from botbuilder.ai.luis.luis_util import LuisUtil
+from botbuilder.core import (
+    IntentScore,
+    Recognizer,
+    RecognizerResult,
+    TurnContext,
+)
+from botbuilder.schema import (
+    Activity,
+    ActivityTypes,
+    ChannelAccount,
+    ConversationAccount,
+)
+
+from .recording_adapter import RecordingAdapter
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def iter_utterances(path: str, chunk_size: int = 64 * 1024) -> Iterator[dict]:
+    """
+    Yields the examples of a JSON array file (test_utterances.json) one at a time,
+    reading the file by chunks instead of loading it whole.
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as utterances_file:
+        buffer = ""
+        position = 0
+        opened = False
+        while True:
+            chunk = utterances_file.read(chunk_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position == len(buffer):
+                    break
+                if not opened:
+                    if buffer[position] != "[":
+                        raise ValueError(f"{path}: a JSON array is expected")
+                    opened = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    example, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The example continues in the next chunk.
+                    break
+                yield example
+            if not chunk:
+                raise ValueError(f"{path}: truncated JSON array")
+
+
+class RecordedRecognizer(Recognizer):
+    """
+    Stand-in for LUIS that answers with recorded predictions, keyed on the utterance.
+    Recordings are lists of recognizer results in the LUIS trace format.
+    """
+
+    def __init__(self, recordings: List[dict] = None):
+        self._results = {}
+        for recording in recordings or []:
+            self._results[recording["text"]] = recording
+
+    @property
+    def is_configured(self) -> bool:
+        return True
+
+    @staticmethod
+    def load(path: str) -> "RecordedRecognizer":
+        with open(path) as recordings_file:
+            return RecordedRecognizer(json.load(recordings_file))
+
+    @staticmethod
+    def save(recognizer_results: Iterable[RecognizerResult], path: str) -> None:
+        with open(path, "w") as recordings_file:
+            json.dump(
+                [LuisUtil.recognizer_result_as_dict(result) for result in recognizer_results],
+                recordings_file,
+            )
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        text = turn_context.activity.text
+        recording = self._results.get(text)
+        if recording is None:
+            return RecognizerResult(
+                text=text, intents={"None": IntentScore(score=1.0)}, entities={}
+            )
+
+        return RecognizerResult(
+            text=text,
+            altered_text=recording.get("alteredText"),
+            intents={
+                name: IntentScore(score=intent["score"])
+                for name, intent in (recording.get("intents") or {}).items()
+            },
+            entities=recording.get("entities") or {},
+        )
+
+
+class EvaluationReport:
+    """
+    Intent accuracy, per-entity precision/recall and recognizer latency of a run.
+    """
+
+    def __init__(self):
+        self.utterances = 0
+        self.correct_intents = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.latencies = []
+        self.true_positives = Counter()
+        self.false_positives = Counter()
+        self.false_negatives = Counter()
+        self.results = []
+
+    @property
+    def intent_accuracy(self) -> float:
+        return self.correct_intents / self.utterances if self.utterances else 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.utterances / self.duration if self.duration else 0.0
+
+    def entity_scores(self) -> Dict[str, Dict[str, float]]:
+        scores = {}
+        entities = set(self.true_positives) | set(self.false_positives) | set(self.false_negatives)
+        for entity in sorted(entities):
+            true_positives = self.true_positives[entity]
+            predicted = true_positives + self.false_positives[entity]
+            expected = true_positives + self.false_negatives[entity]
+            scores[entity] = {
+                "precision": true_positives / predicted if predicted else 0.0,
+                "recall": true_positives / expected if expected else 0.0,
+            }
+        return scores
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "utterances": self.utterances,
+            "errors": self.errors,
+            "intent_accuracy": self.intent_accuracy,
+            "entities": self.entity_scores(),
+            "throughput": self.throughput,
+            "latency": {
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+            },
+        }
+
+
+def _expected_spans(example: dict) -> set:
+    return {
+        (entity["entity"], entity["startPos"], entity["endPos"])
+        for entity in example.get("entities", [])
+    }
+
+
+def _predicted_spans(recognizer_result: RecognizerResult) -> set:
+    instances = (recognizer_result.entities or {}).get("$instance", {})
+    return {
+        (entity, instance["startIndex"], instance["endIndex"])
+        for entity, entity_instances in instances.items()
+        for instance in entity_instances
+    }
+
+
+def _top_intent(recognizer_result: RecognizerResult) -> str:
+    if not recognizer_result.intents:
+        return None
+    return max(
+        recognizer_result.intents,
+        key=lambda name: recognizer_result.intents[name].score,
+    )
+
+
+async def evaluate_utterances(
+    recognizer: Recognizer,
+    utterances: Iterable[dict],
+    concurrency: int = 8,
+    keep_results: bool = False,
+) -> EvaluationReport:
+    """
+    Streams utterances in the test_utterances.json format through the recognizer,
+    with at most 'concurrency' recognitions in flight.
+    """
+    report = EvaluationReport()
+    examples = iter(enumerate(utterances))
+
+    async def worker():
+        for index, example in examples:
+            activity = Activity(
+                type=ActivityTypes.message,
+                id=f"evaluation-{index}",
+                text=example["text"],
+                channel_id="evaluation",
+                conversation=ConversationAccount(id="evaluation"),
+                from_property=ChannelAccount(id="user"),
+                recipient=ChannelAccount(id="bot"),
+            )
+            started = time.perf_counter()
+            try:
+                # The trace activities kept by the adapter are dropped with it.
+                context = TurnContext(RecordingAdapter(), activity)
+                recognizer_result = await recognizer.recognize(context)
+            except Exception:  # pylint: disable=broad-except
+                report.utterances += 1
+                report.errors += 1
+                continue
+            report.latencies.append(time.perf_counter() - started)
+
+            report.utterances += 1
+            if _top_intent(recognizer_result) == example.get("intent"):
+                report.correct_intents += 1
+
+            expected = _expected_spans(example)
+            predicted = _predicted_spans(recognizer_result)
+            for entity, _, _ in expected & predicted:
+                report.true_positives[entity] += 1
+            for entity, _, _ in predicted - expected:
+                report.false_positives[entity] += 1
+            for entity, _, _ in expected - predicted:
+                report.false_negatives[entity] += 1
+
+            if keep_results:
+                report.results.append(recognizer_result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    report.duration = time.perf_counter() - started
+    return report
+
+
+def main():
+    # Imported here: the recognizers import the helpers package.
+    # pylint: disable=import-outside-toplevel
+    from config import DefaultConfig
+    from flight_booking_recognizer import FlightBookingRecognizer
+    from local_flight_booking_recognizer import LocalFlightBookingRecognizer
+
+    parser = argparse.ArgumentParser(
+        description="Evaluates the recognizer over test_utterances.json."
+    )
+    parser.add_argument("utterances", help="test utterances produced by P10_01_data_prep")
+    parser.add_argument("--backend", choices=("luis", "local", "recorded"), default="luis")
+    parser.add_argument("--recordings", help="recorded LUIS predictions to replay or write")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    config = DefaultConfig()
+    if args.backend == "recorded":
+        recognizer = RecordedRecognizer.load(args.recordings)
+    elif args.backend == "local":
+        recognizer = LocalFlightBookingRecognizer(config)
+    else:
+        recognizer = FlightBookingRecognizer(config)
+
+    report = asyncio.run(
+        evaluate_utterances(
+            recognizer,
+            iter_utterances(args.utterances),
+            args.concurrency,
+            keep_results=args.backend == "luis" and args.recordings is not None,
+        )
+    )
+    if report.results:
+        RecordedRecognizer.save(report.results, args.recordings)
+
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
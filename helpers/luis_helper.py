@@ -1,12 +1,33 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
+import logging
+from copy import deepcopy
+from datetime import date, datetime, time
 from enum import Enum
-from typing import Dict
-from recognizers_date_time import recognize_datetime
+from functools import lru_cache
+from typing import Dict, Iterable
+from recognizers_date_time import DateTimeRecognizer
+from recognizers_text import Culture
 from botbuilder.ai.luis import LuisRecognizer
 from botbuilder.core import IntentScore, TopIntent, TurnContext, intent_score
 
 from booking_details import BookingDetails
+from .log_helper import LogHelper
+from .luis_evaluation import EvaluationReport, evaluate_utterances
+from .turn_recognition_cache import TurnRecognitionCache
+
+LOGGER = LogHelper.get_logger("luis")
+
+# LUIS entity -> BookingDetails attribute
+ENTITY_MAPPING = (
+    ("or_city", "origin"),
+    ("dst_city", "destination"),
+    ("str_date", "travel_start_date"),
+    ("end_date", "travel_end_date"),
+    ("budget", "budget"),
+)
+DATE_ENTITIES = frozenset({"str_date", "end_date"})
+DATE_CACHE_SIZE = 4096
 
 
 class Intent(Enum):
@@ -28,46 +49,65 @@ def top_intent(intents: Dict[Intent, dict]) -> TopIntent:
     return TopIntent(max_intent, max_value)
 
 
+@lru_cache(maxsize=1)
+def _datetime_model():
+    # Building the recognizer compiles all of its English patterns.
+    return DateTimeRecognizer(Culture.English).get_datetime_model()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def normalize_date(text: str, reference_date: date) -> str:
+    """
+    Returns the resolved value of a date entity (e.g. 2021-04-15), or the text
+    itself when it does not resolve to a single date.
+    """
+    results = _datetime_model().parse(text, datetime.combine(reference_date, time()))
+    if results:
+        return results[0].resolution["values"][0].get("value", text)
+    return text
+
+
+def get_entities(luis_result, booking_details: BookingDetails) -> None:
+    instances = luis_result.entities.get("$instance", {})
+    reference_date = date.today()
+    for entity, attribute in ENTITY_MAPPING:
+        entity_instances = instances.get(entity)
+        if entity_instances:
+            text = entity_instances[0]["text"]
+            if entity in DATE_ENTITIES:
+                text = normalize_date(text, reference_date)
+            setattr(booking_details, attribute, text)
+
+
 class LuisHelper:
+    # Pre-formatted results of the current turn, shared by Middleware1 and MainDialog.
+    turn_cache = TurnRecognitionCache("LuisHelper.result")
+
     @staticmethod
     async def execute_luis_query(
         luis_recognizer: LuisRecognizer, turn_context: TurnContext
     ) -> (Intent, object, object):
         """
         Returns an object with pre-formatted LUIS results for the bot's dialogs to consume.
+        The query runs once per turn, later calls get a copy of the cached results.
         """
+        cached = LuisHelper.turn_cache.get(turn_context)
+        if cached is not None:
+            intent, score, result = cached
+            return intent, score, deepcopy(result)
+
         result = None
         intent = None
         score = None
 
-
-        def get_entities(luis_result, entities):
-            entities_set = {'or_city', 'dst_city', 'str_date', 'end_date', 'budget'}
-            mapping = {
-                'or_city': 'origin', 'dst_city': 'destination',
-                'str_date': 'travel_start_date', 'end_date': 'travel_end_date',
-                'budget': 'budget'
-            }
-            entities_result = luis_result.entities['$instance']
-            for entity in entities_set:
-                if entity in entities_result:
-                    result = entities_result[entity][0]['text']
-                    if entity in ['str_date', 'dst_date']:
-                        date_recognizer = recognize_datetime(result, 'english-us')
-                        if date_recognizer:
-                            formatted_result = date_recognizer[0].resolution['values'][0]['value']
-                            setattr(entities,mapping[entity],formatted_result)
-                        else:
-                            setattr(entities,mapping[entity],result)
-                    else:
-                        setattr(entities,mapping[entity],result)
-            return()
-
         try:
             recognizer_result = await luis_recognizer.recognize(turn_context)
             
             if recognizer_result.intents:
-                intent = sorted(recognizer_result.intents,key=recognizer_result.intents.get,reverse=True,)[:1][0]
+                intent = max(
+                    recognizer_result.intents,
+                    key=lambda name: recognizer_result.intents[name].score,
+                )
                 score = recognizer_result.intents.get(intent).score
             else:
                 intent =  None
@@ -77,14 +117,31 @@ class LuisHelper:
             get_entities(recognizer_result, result)
 
         except Exception as err:
-            print(err)
-
-        try:
-            print(f"\n-------------[luis_helper.py] text: {turn_context.activity.text}----")
-            print(f"\n-------------[luis_helper.py] intent: {intent} score: {score}----")
-            print(f"\n-------------[luis_helper.py] result: {vars(result)}-------------")
-        except TypeError as err:
-            print(f"\n-------------[luis_helper.py] result: {err}-------------")
+            LOGGER.warning("LUIS query failed: %s", err)
+
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(
+                "LUIS query",
+                extra={"fields": {
+                    "text": turn_context.activity.text,
+                    "intent": intent,
+                    "score": score,
+                    "result": vars(result) if result is not None else None,
+                }},
+            )
+
+        if result is not None:
+            LuisHelper.turn_cache.set(turn_context, (intent, score, deepcopy(result)))
 
         return intent, score, result
 
+    @staticmethod
+    async def evaluate(
+        luis_recognizer: LuisRecognizer, utterances: Iterable[dict], concurrency: int = 8
+    ) -> EvaluationReport:
+        """
+        Measures the recognizer over utterances in the test_utterances.json format:
+        intent accuracy, per-entity precision/recall, throughput and latency.
+        """
+        return await evaluate_utterances(luis_recognizer, utterances, concurrency)
+
@@ -0,0 +1,33 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from typing import List
+
+from botbuilder.core import BotAdapter, TurnContext
+from botbuilder.schema import Activity, ConversationReference, ResourceResponse
+
+
+class RecordingAdapter(BotAdapter):
+    """
+    Adapter of the turn contexts built outside of a real turn (a LUIS call on a
+    worker thread, an evaluation): the activities sent are kept in 'activities'
+    rather than delivered.
+    """
+
+    def __init__(self):
+        super(RecordingAdapter, self).__init__()
+        self.activities = []
+
+    async def send_activities(
+        self, context: TurnContext, activities: List[Activity]
+    ) -> List[ResourceResponse]:
+        self.activities.extend(activities)
+        return [ResourceResponse(id="") for _ in activities]
+
+    async def update_activity(self, context: TurnContext, activity: Activity):
+        # Nothing was delivered, so there is nothing to update.
+        return None
+
+    async def delete_activity(self, context: TurnContext, reference: ConversationReference):
+        # Nothing was delivered, so there is nothing to delete.
+        return None
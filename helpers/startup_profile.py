@@ -0,0 +1,166 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""
+Startup profile of the bot: the import time of each module imported by app.py
+(python -X importtime) and the time a fresh process takes to serve its first
+turn, split in import, application startup (the on_startup hooks), first turn
+and a second, warm turn. LUIS and the Bot Connector are replaced by the fakes
+of helpers.load_test.
+
+    python -m helpers.startup_profile --repeat 5 --top 30 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from .load_test import FAKE_LUIS_APP_ID, FAKE_LUIS_KEY, FakeServices, build_activity
+from .luis_evaluation import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+FIRST_TURN_TEXT = "book a flight from paris to berlin"
+STAGES = ("import", "startup", "first_turn", "second_turn", "first_served_turn", "process")
+
+# Run by the child process: nothing of the bot is imported before it starts.
+FIRST_TURN_SCRIPT = """
+import asyncio, json, sys, time
+
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+from aiohttp.test_utils import TestClient, TestServer
+
+
+async def serve(activities):
+    timings = {"import": imported - start}
+    started = time.perf_counter()
+    async with TestClient(TestServer(app.init_func(None))) as client:
+        timings["startup"] = time.perf_counter() - started
+        statuses = []
+        for stage, activity in zip(("first_turn", "second_turn"), activities):
+            sent = time.perf_counter()
+            response = await client.post("/api/messages", json=activity)
+            await response.read()
+            timings[stage] = time.perf_counter() - sent
+            statuses.append(response.status)
+        timings["first_served_turn"] = timings["import"] + timings["startup"] + timings["first_turn"]
+        timings["statuses"] = statuses
+    return timings
+
+
+print(json.dumps(asyncio.run(serve(json.loads(sys.argv[1])))))
+"""
+
+
+def import_times(module: str = "app", env: Dict[str, str] = None) -> List[dict]:
+    """
+    Import times of the modules imported by 'module', in a fresh interpreter, by
+    decreasing cumulative time (in milliseconds). 'depth' is the nesting of the
+    import, 0 for 'module' itself.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    modules = []
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": max(len(indent) - 1, 0) // 2,
+            })
+    return sorted(modules, key=lambda row: row["cumulative_ms"], reverse=True)
+
+
+def first_turn(service_url: str, env: Dict[str, str] = None) -> dict:
+    """
+    Timings (in seconds) of a fresh process serving its first two turns; 'process'
+    also includes the start and the exit of the interpreter.
+    """
+    activities = [
+        build_activity("startup", 1, service_url, FIRST_TURN_TEXT),
+        build_activity("startup", 2, service_url, FIRST_TURN_TEXT),
+    ]
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", FIRST_TURN_SCRIPT, json.dumps(activities)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    timings = json.loads(process.stdout.splitlines()[-1])
+    timings["process"] = time.perf_counter() - start
+    return timings
+
+
+def summarize(runs: List[dict]) -> dict:
+    """
+    p50 and max of each stage of the runs, in milliseconds.
+    """
+    summary = {}
+    for stage in STAGES:
+        values = sorted(run[stage] * 1000 for run in runs)
+        summary[stage] = {"p50_ms": round(percentile(values, 0.5), 3), "max_ms": round(values[-1], 3)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes timed")
+    parser.add_argument("--top", type=int, default=25, help="modules listed, by cumulative import time")
+    parser.add_argument("--backend", default="luis", choices=("luis", "local"), help="recognizer backend")
+    parser.add_argument("--output", help="file where the JSON report is written")
+    args = parser.parse_args()
+
+    services = FakeServices({})
+    services.start()
+    try:
+        env = dict(
+            os.environ,
+            LUIS_APP_ID=FAKE_LUIS_APP_ID,
+            PREDICTION_KEY=FAKE_LUIS_KEY,
+            PREDICTION_ENDPOINT=services.url,
+            RECOGNIZER_BACKEND=args.backend,
+        )
+        modules = import_times("app", env)
+        runs = [first_turn(services.url, env) for _ in range(args.repeat)]
+    finally:
+        services.stop()
+
+    report = {
+        "python": sys.version.split()[0],
+        "backend": args.backend,
+        "modules": len(modules),
+        "slowest_imports": modules[: args.top],
+        "first_turn": summarize(runs),
+        "runs": runs,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
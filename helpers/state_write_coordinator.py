@@ -0,0 +1,59 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from typing import Awaitable, Callable, List
+
+from botbuilder.core import BotState, Middleware, Storage, TurnContext
+
+from .turn_metrics import TurnMetrics
+
+
+class StateWriteCoordinator(Middleware):
+    """
+    Saves the bot states once, at the end of the turn, with a single storage write.
+    While it is active for a turn, the middlewares and the bot leave the saving to
+    it. A state is written when it was loaded during the turn and changed. All the
+    coordinated states must use the given storage.
+    """
+
+    TURN_STATE_KEY = "StateWriteCoordinator.active"
+
+    def __init__(self, storage: Storage, bot_states: List[BotState]):
+        if storage is None:
+            raise Exception("[StateWriteCoordinator]: Missing parameter. storage is required")
+
+        self.storage = storage
+        self.bot_states = list(bot_states)
+        self.writes = 0
+
+    @staticmethod
+    def is_active(turn_context: TurnContext) -> bool:
+        return StateWriteCoordinator.TURN_STATE_KEY in turn_context.turn_state
+
+    async def on_turn(
+        self, context: TurnContext, logic: Callable[[TurnContext], Awaitable]
+    ):
+        context.turn_state[StateWriteCoordinator.TURN_STATE_KEY] = True
+        await logic()
+        with TurnMetrics.span("state.save"):
+            await self.flush(context)
+
+    async def flush(self, turn_context: TurnContext) -> None:
+        changes = {}
+        written = []
+        for bot_state in self.bot_states:
+            cached_state = bot_state.get_cached_state(turn_context)
+            if cached_state is None:
+                # Never loaded during this turn, so it cannot have changed.
+                continue
+            if cached_state.is_changed:
+                changes[bot_state.get_storage_key(turn_context)] = cached_state.state
+                written.append(cached_state)
+
+        if not changes:
+            return
+
+        await self.storage.write(changes)
+        self.writes += 1
+        for cached_state in written:
+            cached_state.hash = cached_state.compute_hash(cached_state.state)
@@ -0,0 +1,228 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import random
+import sys
+import threading
+from collections import deque
+from typing import Dict, List
+
+from applicationinsights.channel import QueueBase, SenderBase
+
+from .log_helper import LogHelper
+
+LOGGER = LogHelper.get_logger("telemetry")
+
+
+def telemetry_type(envelope) -> str:
+    """
+    Sampling key of an envelope: the name of a custom event, otherwise its type
+    (request, exception, message, metric, remotedependency, pageview).
+    """
+    data = envelope.data
+    if data.base_type == "EventData":
+        return data.base_data.name
+    return data.base_type[: -len("Data")].lower()
+
+
+class _Requeue:
+    # Target of the items a sender could not send, one at a time: they are put
+    # back in the buffer, unsampled, as a batch once the sender returns.
+    def __init__(self):
+        self.items = []
+
+    def put(self, item) -> None:
+        self.items.append(item)
+
+    def take(self) -> list:
+        items, self.items = self.items, []
+        return items
+
+
+class BufferedTelemetryQueue(QueueBase):
+    """
+    Telemetry queue that never sends on the caller's thread: the items are kept
+    in a buffer of at most 'max_buffer' items (the oldest are dropped when it is
+    full) and sent by a background thread in batches of 'batch_size', every
+    'flush_interval' seconds or as soon as a batch is full. 'sampling' keeps a
+    fraction of the items per event name or type, e.g. "WaterfallStep=0.1,
+    request=0.5"; exceptions are always kept. The items a sender fails to send
+    are put back in the buffer, in their order, and retried with the next batch;
+    a batch the sender raises on is lost. The items put once the queue is
+    closed are dropped.
+    """
+
+    def __init__(
+        self,
+        sender: SenderBase,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_buffer: int = 10000,
+        sampling: Dict[str, float] = None,
+    ):
+        super(BufferedTelemetryQueue, self).__init__(None)
+        self._sender = sender
+        self._requeue = sender.queue = _Requeue()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sampling = sampling or {}
+
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+        self.lost = 0
+        self.sampled_out = 0
+        self.requeued = 0
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "sent": self.sent,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "lost": self.lost,
+            "sampled_out": self.sampled_out,
+            "requeued": self.requeued,
+        }
+
+    def _keep(self, item) -> bool:
+        kind = telemetry_type(item)
+        if kind == "exception":
+            return True
+        rate = self.sampling.get(kind, 1.0)
+        if rate >= 1.0:
+            return True
+        # Application Insights scales the counts of the sampled items back up.
+        item.sample_rate = rate * 100
+        return random.random() < rate
+
+    def put(self, item) -> None:
+        if not item:
+            return
+        if not self._keep(item):
+            self.sampled_out += 1
+            return
+
+        with self._lock:
+            if self._closed:
+                # Nothing sends the buffer any more.
+                self.dropped += 1
+                return
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            # The deque drops its oldest item when it is full.
+            self._buffer.append(item)
+        if self._thread is None and not self._closed:
+            self.start()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def requeue(self, items: List[object]) -> None:
+        with self._lock:
+            self.requeued += len(items)
+            # The retried items are older than the buffered ones: with a full
+            # buffer, the oldest of them are dropped.
+            room = self._buffer.maxlen - len(self._buffer)
+            if len(items) > room:
+                self.dropped += len(items) - room
+                items = items[len(items) - room :]
+            self._buffer.extendleft(reversed(items))
+
+    def get(self):
+        with self._lock:
+            return self._buffer.popleft() if self._buffer else None
+
+    def flush(self) -> None:
+        """
+        Asks the background thread to send the buffered items, without waiting.
+        """
+        self._wakeup.set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="telemetry", daemon=True
+            )
+        self._thread.start()
+
+    def _send_batches(self) -> None:
+        while self._buffer:
+            batch = []
+            while len(batch) < self.batch_size:
+                item = self.get()
+                if item is None:
+                    break
+                batch.append(item)
+            try:
+                self._sender.send(batch)
+            except Exception as error:  # pylint: disable=broad-except
+                self._requeue.take()
+                self.lost += len(batch)
+                LOGGER.warning("Telemetry batch lost: %s", error)
+                continue
+            retried = self._requeue.take()
+            if retried:
+                # The sender put the batch back: retried at the next interval.
+                self.requeue(retried)
+                return
+            self.sent += len(batch)
+            self.batches += 1
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._send_batches()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Stops the background thread and sends what is left in the buffer. When
+        the thread is still sending after 'timeout', it is left to send the rest.
+        """
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Draining here too would send the buffer from two threads.
+                LOGGER.warning("Telemetry still sending on close: %s items buffered", len(self._buffer))
+                return
+        self._send_batches()
+
+    # aiohttp signal handler.
+    async def on_cleanup(self, app) -> None:
+        self.close()
+
+
+class FileTelemetrySender(SenderBase):
+    """
+    Writes the telemetry envelopes as JSON lines to a file, or to stdout when
+    'path' is "-", instead of sending them to Application Insights.
+    """
+
+    def __init__(self, path: str = "-"):
+        super(FileTelemetrySender, self).__init__(None)
+        self.path = path
+
+    def send(self, data_to_send: List[object]) -> None:
+        lines = "".join(json.dumps(item.write(), default=str) + "\n" for item in data_to_send)
+        if self.path == "-":
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as sink:
+            sink.write(lines)
@@ -0,0 +1,36 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from functools import lru_cache
+from typing import FrozenSet
+
+from datatypes_date_time.timex import Timex
+
+TIMEX_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=TIMEX_CACHE_SIZE)
+def _parse(timex: str) -> FrozenSet[str]:
+    return frozenset(Timex(timex).types)
+
+
+class TimexCache:
+    """
+    Bounded cache of parsed timex strings shared by the booking and date dialogs,
+    which check the same dates on every waterfall step and reprompt.
+    """
+
+    @staticmethod
+    def types(timex: str) -> FrozenSet[str]:
+        """
+        Returns the types of the timex (definite, date, daterange, ...).
+        """
+        return _parse(timex)
+
+    @staticmethod
+    def is_definite(timex: str) -> bool:
+        return "definite" in _parse(timex)
+
+    @staticmethod
+    def cache_info():
+        return _parse.cache_info()
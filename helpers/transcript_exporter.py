@@ -0,0 +1,208 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from botbuilder.core import Storage
+
+from .log_helper import LogHelper
+
+LOGGER = LogHelper.get_logger("export")
+
+
+class TranscriptExporter:
+    """
+    Exports the transcripts of the failed conversations in the background.
+    The transcripts are queued by the turns, and written to the storage in
+    batches of 'batch_size' documents, or every 'flush_interval' seconds.
+    A failed write is retried with an exponential backoff; after 'max_retries'
+    attempts, or when the queue is full, the documents are appended to the
+    spill file and queued again on the next start.
+    The writes run on a worker thread, as the Cosmos DB client blocks.
+    The background task is started by start() (the startup hook), or else by
+    the first document queued from the event loop.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        batch_size: int = 20,
+        flush_interval: float = 2.0,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_queue: int = 1000,
+        spill_path: str = None,
+    ):
+        if storage is None:
+            raise Exception("[TranscriptExporter]: Missing parameter. storage is required")
+
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.spill_path = spill_path
+
+        self._queue = []
+        self._wakeup = None
+        self._task = None
+        self._executor = None
+        self._stopped = False
+
+        self.exported = 0
+        self.batches = 0
+        self.retries = 0
+        self.spilled = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "exported": self.exported,
+            "batches": self.batches,
+            "retries": self.retries,
+            "spilled": self.spilled,
+        }
+
+    def enqueue(self, key: str, document: object) -> None:
+        """
+        Queues a document without waiting for it to be written.
+        """
+        if len(self._queue) >= self.max_queue:
+            self._spill({key: document})
+            return
+
+        self._queue.append((key, document))
+        if self._task is None and not self._stopped:
+            try:
+                self._start(asyncio.get_running_loop())
+            except RuntimeError:
+                # Not on the event loop: queued until start().
+                pass
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        self._stopped = False
+        if self._task is None:
+            self._start(asyncio.get_running_loop())
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+        self._wakeup = asyncio.Event()
+        self._queue[:0] = self._load_spilled()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and flushes the queue; what cannot be
+        written is spilled to disk.
+        """
+        self._stopped = True
+        if self._task is None:
+            return
+
+        task, self._task = self._task, None
+        self._wakeup.set()
+        await task
+        while self._queue:
+            await self.flush()
+
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._wakeup = None
+
+    # aiohttp signal handlers.
+    async def on_startup(self, app) -> None:
+        await self.start()
+
+    async def on_cleanup(self, app) -> None:
+        await self.stop()
+
+    async def _run(self) -> None:
+        while self._task is not None:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            while self._queue and self._task is not None:
+                await self.flush()
+                if len(self._queue) < self.batch_size:
+                    break
+
+    async def flush(self) -> None:
+        """
+        Writes the next batch of the queue.
+        """
+        if not self._queue:
+            return
+
+        batch = dict(self._queue[: self.batch_size])
+        del self._queue[: self.batch_size]
+
+        for attempt in range(self.max_retries):
+            try:
+                await self._write(batch)
+            except Exception as error:  # pylint: disable=broad-except
+                LOGGER.warning(
+                    "Transcript export failed",
+                    extra={"fields": {"attempt": attempt + 1, "error": str(error)}},
+                )
+                if attempt + 1 < self.max_retries:
+                    self.retries += 1
+                    delay = self.backoff * 2 ** attempt
+                    await asyncio.sleep(delay * (0.5 + random.random() / 2))
+                continue
+
+            self.exported += len(batch)
+            self.batches += 1
+            return
+
+        self._spill(batch)
+
+    async def _write(self, batch: Dict[str, object]) -> None:
+        if self._executor is None:
+            await self.storage.write(batch)
+            return
+
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, asyncio.run, self.storage.write(batch)
+        )
+
+    def _spill(self, batch: Dict[str, object]) -> None:
+        if not self.spill_path:
+            LOGGER.error(
+                "Transcripts dropped", extra={"fields": {"documents": len(batch)}}
+            )
+            return
+
+        directory = os.path.dirname(self.spill_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.spill_path, "a") as spill_file:
+            for key, document in batch.items():
+                spill_file.write(json.dumps({"key": key, "document": document}) + "\n")
+        self.spilled += len(batch)
+        LOGGER.warning(
+            "Transcripts spilled to disk",
+            extra={"fields": {"documents": len(batch), "path": self.spill_path}},
+        )
+
+    def _load_spilled(self) -> List[tuple]:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+
+        with open(self.spill_path) as spill_file:
+            records = [json.loads(line) for line in spill_file if line.strip()]
+        os.remove(self.spill_path)
+        return [(record["key"], record["document"]) for record in records]
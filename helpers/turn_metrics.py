@@ -0,0 +1,151 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import re
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from aiohttp import web
+from botbuilder.dialogs import ComponentDialog, Dialog, WaterfallDialog
+
+# Upper bounds (seconds) of the buckets of the stage durations.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "bot"
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        # One count per bucket, plus the values above the last bound.
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+def _waterfalls(dialog: Dialog):
+    if isinstance(dialog, WaterfallDialog):
+        yield dialog
+    if isinstance(dialog, ComponentDialog):
+        for child in dialog._dialogs._dialogs.values():  # pylint: disable=protected-access
+            yield from _waterfalls(child)
+
+
+def instrument_waterfalls(dialog: Dialog, observe: Callable[[str, float], None]) -> None:
+    """
+    Wraps the steps of the waterfalls of the dialog, and of its child dialogs, so
+    that their durations are passed to 'observe' with the name of the step (for
+    instance BookingDialog.origin_step). A step starting a child dialog includes
+    its first turn. Instrumenting a dialog again only replaces 'observe'.
+    """
+
+    def timed(step):
+        async def timed_step(step_context):
+            start = time.perf_counter()
+            try:
+                return await step(step_context)
+            finally:
+                timed_step.observe(step.__qualname__, time.perf_counter() - start)
+
+        # The waterfall names its telemetry events after the step.
+        timed_step.__qualname__ = step.__qualname__
+        return timed_step
+
+    for waterfall in _waterfalls(dialog):
+        steps = waterfall._steps  # pylint: disable=protected-access
+        steps[:] = [step if hasattr(step, "observe") else timed(step) for step in steps]
+        for step in steps:
+            step.observe = observe
+
+
+class TurnMetrics:
+    """
+    Process-wide durations of the stages of a turn (recognition, state load and
+    save, dialog, waterfall steps, storage, outgoing activities) and statistics
+    of the components, rendered in the Prometheus text format on /metrics.
+    """
+
+    enabled = True
+    _stages: Dict[str, _Histogram] = {}
+    _collectors: Dict[str, Callable[[], dict]] = {}
+
+    @staticmethod
+    def configure(enabled: bool = True) -> None:
+        TurnMetrics.enabled = enabled
+
+    @staticmethod
+    def observe(stage: str, seconds: float) -> None:
+        if not TurnMetrics.enabled:
+            return
+        histogram = TurnMetrics._stages.get(stage)
+        if histogram is None:
+            histogram = TurnMetrics._stages[stage] = _Histogram()
+        histogram.observe(seconds)
+
+    @staticmethod
+    @contextmanager
+    def span(stage: str):
+        """
+        Records the duration of the block, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            TurnMetrics.observe(stage, time.perf_counter() - start)
+
+    @staticmethod
+    def instrument(dialog: Dialog) -> None:
+        """
+        Records each waterfall step of the dialog as the stage "step.<step>".
+        """
+        instrument_waterfalls(
+            dialog, lambda step, seconds: TurnMetrics.observe(f"step.{step}", seconds)
+        )
+
+    @staticmethod
+    def register(name: str, collector: Callable[[], dict]) -> None:
+        """
+        Adds the numbers returned by 'collector' (e.g. AdmissionControl.stats) to
+        the rendered metrics, as bot_<name>_<key>.
+        """
+        TurnMetrics._collectors[name] = collector
+
+    @staticmethod
+    def render() -> str:
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Duration of the stages of the turns.",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(TurnMetrics._stages.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        for name, collector in sorted(TurnMetrics._collectors.items()):
+            for key, value in sorted(collector().items()):
+                if isinstance(value, (bool, int, float)):
+                    metric = re.sub(r"[^a-zA-Z0-9_]", "_", f"{PREFIX}_{name}_{key}")
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value if isinstance(value, float) else int(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    async def handler(request: web.Request) -> web.Response:
+        # pylint: disable=unused-argument
+        return web.Response(
+            body=TurnMetrics.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
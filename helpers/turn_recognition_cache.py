@@ -0,0 +1,41 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from botbuilder.core import TurnContext
+
+
+class TurnRecognitionCache:
+    """
+    Keeps a recognition result in the turn state so that the middleware and the
+    dialogs share a single LUIS query per incoming message.
+    The entry is keyed on the activity id and text, so it is never served for
+    another activity, and it is discarded with the turn context.
+    """
+
+    def __init__(self, name: str):
+        self._turn_state_key = name
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(turn_context: TurnContext) -> tuple:
+        activity = turn_context.activity
+        return (activity.id, activity.text)
+
+    def get(self, turn_context: TurnContext) -> object:
+        """
+        Returns the value cached for the current activity, or None.
+        """
+        cached = turn_context.turn_state.get(self._turn_state_key)
+        if cached is not None and cached[0] == self.cache_key(turn_context):
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        return None
+
+    def set(self, turn_context: TurnContext, value: object) -> None:
+        turn_context.turn_state[self._turn_state_key] = (
+            self.cache_key(turn_context),
+            value,
+        )
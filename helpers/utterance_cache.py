@@ -0,0 +1,133 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import sys
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Callable
+
+from botbuilder.core import RecognizerResult
+
+
+def _deep_sizeof(obj: object, seen: set = None) -> int:
+    """
+    Approximates the memory footprint of a recognizer result in bytes.
+    """
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), seen)
+    return size
+
+
+class UtteranceCache:
+    """
+    Bounded cache of LUIS results shared by all conversations.
+    Entries are keyed on the normalized utterance and the LUIS application
+    id/version, evicted in least recently used order and expire after a TTL.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 3600.0,
+        model_id: str = "",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_size < 1:
+            raise Exception("[UtteranceCache]: max_size must be at least 1")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model_id = model_id
+        self._clock = clock
+        # key -> (expiry time, size in bytes, recognizer result)
+        self._entries = OrderedDict()
+        self._memory_usage = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).casefold()
+
+    def _key(self, text: str) -> tuple:
+        return (self.model_id, self.normalize(text))
+
+    def _remove(self, key: tuple) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._memory_usage -= size
+
+    def get(self, text: str) -> RecognizerResult:
+        """
+        Returns a copy of the cached result for this utterance, or None.
+        """
+        key = self._key(text)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self._clock():
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        recognizer_result = deepcopy(entry[2])
+        recognizer_result.text = text
+        return recognizer_result
+
+    def set(self, text: str, recognizer_result: RecognizerResult) -> None:
+        key = self._key(text)
+        if key in self._entries:
+            self._remove(key)
+
+        value = deepcopy(recognizer_result)
+        size = _deep_sizeof(value)
+        self._entries[key] = (self._clock() + self.ttl, size, value)
+        self._memory_usage += size
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._memory_usage = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def memory_usage(self) -> int:
+        """
+        Approximate size of the cached results in bytes.
+        """
+        return self._memory_usage
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_usage": self._memory_usage,
+        }
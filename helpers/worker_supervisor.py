@@ -0,0 +1,102 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import multiprocessing
+import os
+import signal
+import time
+from typing import Callable
+
+from .log_helper import LogHelper
+
+LOGGER = LogHelper.get_logger("workers")
+
+
+def _run_worker(target: Callable[[int], None], worker_id: int) -> None:
+    # The supervisor alone receives the signals of the terminal, and
+    # forwards them once to the workers.
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    target(worker_id)
+
+
+class WorkerSupervisor:
+    """
+    Runs 'target(worker_id)' in 'workers' processes, restarts the ones that
+    exit unexpectedly, and stops them all on SIGINT / SIGTERM.
+    The processes are spawned, not forked: each one imports the main module
+    again and so builds its own recognizer, telemetry client and states.
+    On shutdown every worker receives a SIGTERM, on which aiohttp drains the
+    pending requests before running the cleanup handlers.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int], None],
+        workers: int,
+        shutdown_timeout: float = 30.0,
+        restart_delay: float = 1.0,
+    ):
+        self.target = target
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def _start(self, worker_id: int) -> None:
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.target, worker_id),
+            name=f"bot-worker-{worker_id}",
+        )
+        process.start()
+        self._processes[worker_id] = process
+        LOGGER.info(
+            "Worker started", extra={"fields": {"worker": worker_id, "pid": process.pid}}
+        )
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        previous_handlers = {
+            signum: signal.signal(signum, self._stop)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            for worker_id in range(self.workers):
+                self._start(worker_id)
+
+            while not self._stopping:
+                time.sleep(0.2)
+                for worker_id, process in list(self._processes.items()):
+                    if process.is_alive() or self._stopping:
+                        continue
+                    LOGGER.warning(
+                        "Worker exited",
+                        extra={"fields": {"worker": worker_id, "exitcode": process.exitcode}},
+                    )
+                    time.sleep(self.restart_delay)
+                    self.restarts += 1
+                    self._start(worker_id)
+        finally:
+            self.shutdown()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def shutdown(self) -> None:
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout + 5.0
+        for worker_id, process in self._processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                LOGGER.warning("Worker killed", extra={"fields": {"worker": worker_id}})
+                process.kill()
+                process.join()
+        self._processes.clear()
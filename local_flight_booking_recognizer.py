@@ -0,0 +1,253 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from botbuilder.core import IntentScore, Recognizer, RecognizerResult, TurnContext
+
+from config import DefaultConfig
+
+FEATURES_DIMENSION = 2 ** 12
+SOFTMAX_TEMPERATURE = 10.0
+
+CITY_ENTITIES = ("or_city", "dst_city")
+DATE_ENTITIES = ("str_date", "end_date")
+
+ORIGIN_CUES = {"from", "leaving", "leave", "departing", "depart", "out"}
+DESTINATION_CUES = {"to", "for", "visit", "visiting", "into", "towards", "going"}
+RETURN_CUES = {"return", "returning", "back", "until", "till", "end", "ending"}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9$]+")
+MONTHS = (
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+)
+DATE_PATTERN = re.compile(
+    rf"\b(?:(?:{MONTHS})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?"
+    rf"|\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?(?:{MONTHS})(?:,?\s+\d{{4}})?"
+    r"|\d{1,2}/\d{1,2}(?:/\d{2,4})?"
+    r"|(?:today|tomorrow|tonight))\b",
+    re.IGNORECASE,
+)
+BUDGET_PATTERN = re.compile(
+    r"\$\s?\d[\d,.]*\s?k?\b|\b\d[\d,.]*\s?(?:k\b)?\s?(?:dollars|usd|bucks)\b",
+    re.IGNORECASE,
+)
+CITY_CUE_PATTERN = re.compile(
+    r"\b(from|to)\s+((?:[A-Z][\w'-]*)(?:\s+[A-Z][\w'-]*)*)"
+)
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _read_example(example: dict) -> Tuple[str, str, List[Tuple[str, int, int]]]:
+    """
+    Reads an utterance in the train or the test format of P10_01_data_prep.
+    """
+    text = example["text"]
+    intent = example.get("intent_name", example.get("intent"))
+    labels = example.get("entity_labels", example.get("entities", []))
+    spans = [
+        (
+            label.get("entity_name", label.get("entity")),
+            label.get("start_char_index", label.get("startPos")),
+            label.get("end_char_index", label.get("endPos")),
+        )
+        for label in labels
+    ]
+    return text, intent, spans
+
+
+class LocalFlightBookingRecognizer(Recognizer):
+    """
+    In-process recognizer for the 'inform'/'None' intents and the flight booking
+    entities, trained from the train_utterances.json produced by P10_01_data_prep.
+    Intents are scored against hashed bag-of-words centroids, entities are found
+    with a gazetteer of the labelled spans completed by date, budget and city rules.
+    It returns results in the LUIS format so that LuisHelper can consume them.
+    """
+
+    def __init__(
+        self,
+        configuration: DefaultConfig = None,
+        train_utterances: List[dict] = None,
+    ):
+        self._numpy = None
+        self._intents = []
+        self._centroids = None
+        self._gazetteer = {}
+        self._gazetteer_pattern = None
+
+        if train_utterances is None and configuration is not None:
+            train_file = configuration.LOCAL_RECOGNIZER_TRAIN_FILE
+            if train_file and os.path.exists(train_file):
+                with open(train_file) as utterances_file:
+                    train_utterances = json.load(utterances_file)
+
+        if train_utterances:
+            self.train(train_utterances)
+
+    @property
+    def is_configured(self) -> bool:
+        # Returns true once a model has been trained.
+        return self._centroids is not None
+
+    def _featurize(self, texts: List[str]) -> "numpy.ndarray":
+        np = self._numpy
+        features = np.zeros((len(texts), FEATURES_DIMENSION), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _tokens(text)
+            grams = tokens + [" ".join(pair) for pair in zip(tokens, tokens[1:])]
+            if not grams:
+                continue
+            columns = [zlib.crc32(gram.encode()) % FEATURES_DIMENSION for gram in grams]
+            np.add.at(features[row], columns, 1.0)
+
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        return features / np.maximum(norms, 1e-9)
+
+    def train(self, train_utterances: List[dict]) -> None:
+        texts, intents = [], []
+        gazetteer = defaultdict(Counter)
+
+        for example in train_utterances:
+            text, intent, spans = _read_example(example)
+            texts.append(text)
+            intents.append(intent or "None")
+            for entity, start, end in spans:
+                phrase = " ".join(text[start:end].lower().split())
+                if phrase:
+                    gazetteer[phrase][entity] += 1
+
+        if self._numpy is None:
+            # numpy is imported with the first model trained, not with the bot.
+            import numpy  # pylint: disable=import-outside-toplevel
+
+            self._numpy = numpy
+        np = self._numpy
+        self._intents = sorted(set(intents))
+        features = self._featurize(texts)
+        labels = np.array(intents)
+        centroids = np.stack(
+            [features[labels == intent].mean(axis=0) for intent in self._intents]
+        )
+        self._centroids = centroids / np.maximum(
+            np.linalg.norm(centroids, axis=1, keepdims=True), 1e-9
+        )
+
+        self._gazetteer = {
+            phrase: counts.most_common(1)[0][0] for phrase, counts in gazetteer.items()
+        }
+        if self._gazetteer:
+            phrases = sorted(self._gazetteer, key=len, reverse=True)
+            self._gazetteer_pattern = re.compile(
+                r"\b(?:" + "|".join(re.escape(phrase) for phrase in phrases) + r")\b",
+                re.IGNORECASE,
+            )
+        else:
+            self._gazetteer_pattern = None
+
+    def _score_intents(self, text: str) -> Dict[str, IntentScore]:
+        np = self._numpy
+        similarities = self._centroids @ self._featurize([text])[0]
+        exponentials = np.exp(SOFTMAX_TEMPERATURE * (similarities - similarities.max()))
+        scores = exponentials / exponentials.sum()
+        return {
+            intent: IntentScore(float(score))
+            for intent, score in zip(self._intents, scores)
+        }
+
+    @staticmethod
+    def _previous_words(text: str, start: int, count: int = 3) -> List[str]:
+        return _tokens(text[:start])[-count:]
+
+    def _find_spans(self, text: str) -> List[Tuple[str, int, int]]:
+        spans = []
+        taken = bytearray(len(text) + 1)
+
+        def add(entity: str, start: int, end: int) -> None:
+            if not any(taken[start:end]):
+                taken[start:end] = b"\x01" * (end - start)
+                spans.append((entity, start, end))
+
+        for match in BUDGET_PATTERN.finditer(text):
+            add("budget", match.start(), match.end())
+
+        if self._gazetteer_pattern is not None:
+            for match in self._gazetteer_pattern.finditer(text):
+                phrase = " ".join(match.group().lower().split())
+                add(self._gazetteer[phrase], match.start(), match.end())
+
+        for match in DATE_PATTERN.finditer(text):
+            add("str_date", match.start(), match.end())
+
+        for match in CITY_CUE_PATTERN.finditer(text):
+            entity = "or_city" if match.group(1) == "from" else "dst_city"
+            add(entity, match.start(2), match.end(2))
+
+        return sorted(spans, key=lambda span: span[1])
+
+    def _resolve_roles(self, text: str, spans: List[Tuple[str, int, int]]) -> list:
+        """
+        Origin/destination and start/end dates share their surface forms,
+        the words in front of each span decide which role it plays.
+        """
+        resolved = []
+        seen_dates = 0
+        for entity, start, end in spans:
+            previous = self._previous_words(text, start)
+            if entity in CITY_ENTITIES:
+                # The closest cue wins: "from Paris to Berlin".
+                for word in reversed(previous):
+                    if word in ORIGIN_CUES:
+                        entity = "or_city"
+                        break
+                    if word in DESTINATION_CUES:
+                        entity = "dst_city"
+                        break
+            elif entity in DATE_ENTITIES:
+                if RETURN_CUES.intersection(previous) or seen_dates:
+                    entity = "end_date"
+                else:
+                    entity = "str_date"
+                seen_dates += 1
+            resolved.append((entity, start, end))
+        return resolved
+
+    def predict(self, text: str) -> RecognizerResult:
+        """
+        Recognizes an utterance without a turn context.
+        """
+        if not text or text.isspace():
+            return RecognizerResult(
+                text=text, intents={"": IntentScore(score=1.0)}, entities={}
+            )
+
+        entities = {"$instance": {}}
+        for entity, start, end in self._resolve_roles(text, self._find_spans(text)):
+            entities.setdefault(entity, []).append(text[start:end])
+            entities["$instance"].setdefault(entity, []).append(
+                {
+                    "startIndex": start,
+                    "endIndex": end,
+                    "text": text[start:end].lower(),
+                    "type": entity,
+                }
+            )
+
+        return RecognizerResult(
+            text=text,
+            altered_text=None,
+            intents=self._score_intents(text),
+            entities=entities,
+        )
+
+    async def recognize(self, turn_context: TurnContext) -> RecognizerResult:
+        return self.predict(turn_context.activity.text)
@@ -1,5 +1,5 @@
+import logging
 from typing import Callable, Awaitable
-from botbuilder.azure.cosmosdb_storage import CosmosDbStorage
 from botbuilder.core import Middleware, TurnContext, MessageFactory
 from botbuilder.core.conversation_state import ConversationState
 from botbuilder.schema import ActivityTypes, InputHints
@@ -7,7 +7,15 @@ from botbuilder.schema import ActivityTypes, InputHints
 from flight_booking_recognizer import FlightBookingRecognizer
 from data_model import ConState
 
-from helpers import LuisHelper
+from helpers import (
+    LuisHelper,
+    LogHelper,
+    StateWriteCoordinator,
+    TranscriptExporter,
+    TurnMetrics,
+)
+
+LOGGER = LogHelper.get_logger("middleware")
 
 class Middleware1(Middleware):
 
@@ -33,10 +41,11 @@ class Middleware1(Middleware):
             else:
                 # Call LUIS and gather any potential booking details.
                 # (Note the TurnContext has the response to the prompt.)
-                _, _, luis_result = await LuisHelper.execute_luis_query(
-                    self._luis_recognizer,
-                    turn_context
-                )
+                with TurnMetrics.span("middleware1.recognize"):
+                    _, _, luis_result = await LuisHelper.execute_luis_query(
+                        self._luis_recognizer,
+                        turn_context
+                    )
 
                 if luis_result is not None:
                     turn_context.turn_state['destination'] = luis_result.destination
@@ -55,10 +64,19 @@ class Middleware1(Middleware):
 
 class Middleware2(Middleware):
 
-    def __init__(self, constate: ConversationState, cosmosdb: CosmosDbStorage) -> None:
+    def __init__(
+        self,
+        constate: ConversationState,
+        exporter: TranscriptExporter,
+        transcript_max_entries: int = 100,
+    ) -> None:
         self.constate = constate
         self.conprop = self.constate.create_property("constate")
-        self.cosmosdb = cosmosdb
+        self.exporter = exporter
+        self.transcript_max_entries = transcript_max_entries
+
+    def _create_constate(self) -> ConState:
+        return ConState(self.transcript_max_entries)
 
     async def on_turn(
         self,
@@ -68,13 +86,14 @@ class Middleware2(Middleware):
 
         if turn_context.activity.type == ActivityTypes.message:
 
-            conmode = await self.conprop.get(turn_context,ConState)
-            conmode.conversation.append("[User]: " + turn_context.activity.text)
+            with TurnMetrics.span("middleware2.state_load"):
+                conmode = await self.conprop.get(turn_context, self._create_constate)
+            conmode.conversation.append_user(turn_context.activity.text)
 
             async def send_activity_handler(new_context, activities, next_send):
                 for activity in activities:
                     if activity.text is not None:
-                        conmode.conversation.append("[Bot]: " + activity.text)
+                        conmode.conversation.append_bot(activity.text)
                 await next_send()
 
             turn_context = turn_context.on_send_activities(send_activity_handler)
@@ -82,21 +101,25 @@ class Middleware2(Middleware):
             await next()
 
             if turn_context.turn_state['failed']:
-                print(f"\n-------------[middleware1.py =>] Failed ?: \
-                    {turn_context.turn_state['failed']}")
-                print(f"\n-------------[middleware1.py =>] conmode.conversation: \
-                    {conmode.conversation}")
-
                 activity_id = (turn_context
                     .get_conversation_reference(turn_context.activity)
                     .activity_id)
                 activity_id_str = str(activity_id)
 
-                collection_store = {activity_id_str: conmode.conversation}
-                await self.cosmosdb.write(collection_store)
+                LOGGER.info("Booking failed", extra={"fields": {"activity_id": activity_id_str}})
+                if LOGGER.isEnabledFor(logging.DEBUG):
+                    LOGGER.debug(
+                        "Failed conversation",
+                        extra={"fields": {"conversation": conmode.conversation.lines()}},
+                    )
 
+                # Written to Cosmos DB in the background, the user does not wait for it.
+                self.exporter.enqueue(activity_id_str, conmode.conversation.lines())
 
-            await self.constate.save_changes(turn_context)
+            # The StateWriteCoordinator, when used, saves all the states at the end of the turn.
+            if not StateWriteCoordinator.is_active(turn_context):
+                with TurnMetrics.span("middleware2.state_save"):
+                    await self.constate.save_changes(turn_context)
 
         if turn_context.activity.type == ActivityTypes.conversation_update:
             await next()
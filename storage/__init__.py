@@ -0,0 +1,20 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from .cached_storage import CachedStorage
+from .conversation_leases import ConversationLeases
+from .e_tags import ETagConflictError, get_e_tag, set_e_tag
+from .lazy_storage import LazyStorage
+from .sqlite_storage import SqliteStorage
+from .timed_storage import TimedStorage
+
+__all__ = [
+    "CachedStorage",
+    "ConversationLeases",
+    "ETagConflictError",
+    "LazyStorage",
+    "SqliteStorage",
+    "TimedStorage",
+    "get_e_tag",
+    "set_e_tag",
+]
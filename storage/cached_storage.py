@@ -0,0 +1,109 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Dict, List
+
+from botbuilder.core import Storage, StoreItem
+
+from .e_tags import get_e_tag
+
+
+class CachedStorage(Storage):
+    """
+    Read-through / write-through LRU cache of the last 'max_size' items of a
+    storage. It must be the only writer of the storage, so the items it cached
+    are still current: it is not used with several worker processes. The items
+    are copied in and out of the cache, as the bot states modify them.
+    After a write, an item is cached only if its e_tag is known to match the
+    stored one: the backend updated it, or it has none. A write rejected by
+    the backend (e.g. an e_tag conflict) evicts the items of the batch.
+    """
+
+    def __init__(self, storage: Storage, max_size: int = 1000):
+        if storage is None:
+            raise Exception("[CachedStorage]: Missing parameter. storage is required")
+
+        self.storage = storage
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def _cache(self, key: str, item: object) -> None:
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    async def read(self, keys: List[str]):
+        data = {}
+        if not keys:
+            return data
+
+        missing = []
+        for key in keys:
+            item = self._items.get(key)
+            if item is None:
+                missing.append(key)
+                continue
+            self._items.move_to_end(key)
+            data[key] = deepcopy(item)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            items = await self.storage.read(missing)
+            for key, item in items.items():
+                self._cache(key, deepcopy(item))
+                data[key] = item
+        return data
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        if not changes:
+            await self.storage.write(changes)
+            return
+
+        e_tags = {key: get_e_tag(change) for key, change in changes.items()}
+        try:
+            await self.storage.write(changes)
+        except Exception:
+            for key in changes:
+                self._items.pop(key, None)
+            raise
+
+        for key, change in changes.items():
+            e_tag = get_e_tag(change)
+            if e_tag in (None, "*") or e_tag != e_tags[key]:
+                self._cache(key, deepcopy(change))
+            else:
+                self._items.pop(key, None)
+
+    async def delete(self, keys: List[str]):
+        for key in keys or []:
+            self._items.pop(key, None)
+        await self.storage.delete(keys)
+
+    def clear(self) -> None:
+        self._items.clear()
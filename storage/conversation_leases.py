@@ -0,0 +1,53 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import uuid
+
+from .sqlite_storage import SqliteStorage
+
+
+class ConversationLeases:
+    """
+    Orders the turns of a conversation across the worker processes sharing a
+    SqliteStorage: a turn holds the lease of its conversation, a row of the
+    database, while it runs, and the turns of the other workers poll until it is
+    released. A lease expires after 'ttl' seconds, so a worker that died holding
+    it blocks its conversation for 'ttl' at most; a turn running longer than
+    'ttl' loses its lease, and the e_tag check of its state write then fails.
+    Used by ConversationLocks, which orders the turns within the process first.
+    """
+
+    def __init__(
+        self,
+        storage: SqliteStorage,
+        ttl: float = 30.0,
+        poll_interval: float = 0.01,
+        max_poll_interval: float = 0.2,
+    ):
+        if storage is None:
+            raise Exception("[ConversationLeases]: Missing parameter. storage is required")
+
+        self._storage = storage
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        # Identifies the leases of this process.
+        self.owner = uuid.uuid4().hex
+        self.acquired = 0
+        self.waits = 0
+
+    def stats(self) -> dict:
+        return {"acquired": self.acquired, "waits": self.waits}
+
+    async def acquire(self, conversation_id: str) -> None:
+        delay = self.poll_interval
+        while not await self._storage.acquire_lease(conversation_id, self.owner, self.ttl):
+            if delay == self.poll_interval:
+                self.waits += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+        self.acquired += 1
+
+    async def release(self, conversation_id: str) -> None:
+        await self._storage.release_lease(conversation_id, self.owner)
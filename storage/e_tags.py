@@ -0,0 +1,28 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+
+def get_e_tag(item: object):
+    """
+    Returns the e_tag of a stored item, a dict or a StoreItem; None when it has none.
+    """
+    if isinstance(item, dict):
+        return item.get("e_tag", None)
+    return getattr(item, "e_tag", None)
+
+
+def set_e_tag(item: object, e_tag: str) -> None:
+    """
+    Sets the e_tag of a stored item, when it is a dict or has an e_tag attribute.
+    """
+    if isinstance(item, dict):
+        item["e_tag"] = e_tag
+    elif hasattr(item, "e_tag"):
+        item.e_tag = e_tag
+
+
+class ETagConflictError(KeyError):
+    """
+    Raised when an item is written with an e_tag that is no longer the stored one:
+    another turn changed the item since it was read.
+    """
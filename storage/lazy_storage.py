@@ -0,0 +1,24 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from typing import Dict, List
+
+from botbuilder.core import Storage, StoreItem
+
+from helpers import LazyComponent
+
+
+class LazyStorage(LazyComponent, Storage):
+    """
+    Storage built on its first read, write or delete; for instance the Cosmos DB
+    client, which connects to its account when it is created.
+    """
+
+    async def read(self, keys: List[str]) -> Dict[str, StoreItem]:
+        return await self.get().read(keys)
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        await self.get().write(changes)
+
+    async def delete(self, keys: List[str]):
+        await self.get().delete(keys)
@@ -0,0 +1,204 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from botbuilder.core import Storage, StoreItem
+
+from .e_tags import ETagConflictError, get_e_tag, set_e_tag
+
+# SQLite limits the number of parameters of a statement.
+MAX_KEYS_PER_QUERY = 500
+
+
+class SqliteStorage(Storage):
+    """
+    Storage in a local SQLite database in WAL mode, which several worker
+    processes can share. The items are pickled and compressed; the reads and
+    the writes of a call are made with one statement / one transaction.
+    Every write gives the item a new e_tag (set on the written item as well);
+    writing an item whose e_tag is not "*" and differs from the stored one
+    raises an ETagConflictError (a KeyError, like MemoryStorage) and none of the
+    changes is written. The database also holds the leases of
+    ConversationLeases.
+    The database is used from a single worker thread, so no call blocks the
+    event loop.
+    """
+
+    def __init__(self, path: str, compression_level: int = 1):
+        if not path:
+            raise Exception("[SqliteStorage]: Missing parameter. path is required")
+
+        self.path = path
+        self.compression_level = compression_level
+        self._connection = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Transactions are started explicitly.
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "key TEXT PRIMARY KEY, e_tag INTEGER NOT NULL, value BLOB NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args
+        )
+
+    def _dumps(self, item: object) -> bytes:
+        return zlib.compress(
+            pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL), self.compression_level
+        )
+
+    @staticmethod
+    def _loads(value: bytes) -> object:
+        return pickle.loads(zlib.decompress(value))
+
+    async def read(self, keys: List[str]):
+        if not keys:
+            return {}
+        return await self._run(self._read, list(keys))
+
+    def _read(self, keys: List[str]) -> Dict[str, object]:
+        connection = self._connect()
+        data = {}
+        for start in range(0, len(keys), MAX_KEYS_PER_QUERY):
+            chunk = keys[start : start + MAX_KEYS_PER_QUERY]
+            rows = connection.execute(
+                f"SELECT key, e_tag, value FROM items WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, e_tag, value in rows:
+                item = self._loads(value)
+                set_e_tag(item, str(e_tag))
+                data[key] = item
+        return data
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        if changes is None:
+            raise Exception("Changes are required when writing")
+        if not changes:
+            return
+
+        # Serialized on the event loop, as the items may still be modified afterwards.
+        rows = []
+        for key, change in changes.items():
+            e_tag = get_e_tag(change)
+            if e_tag == "":
+                raise Exception("sqlite_storage.write(): etag missing")
+            rows.append((key, e_tag, self._dumps(change)))
+
+        new_e_tags = await self._run(self._write, rows)
+        for key, change in changes.items():
+            set_e_tag(change, new_e_tags[key])
+
+    def _write(self, rows: List[tuple]) -> Dict[str, str]:
+        connection = self._connect()
+        new_e_tags = {}
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for key, e_tag, value in rows:
+                row = connection.execute(
+                    "SELECT e_tag FROM items WHERE key = ?", (key,)
+                ).fetchone()
+                stored_e_tag = None if row is None else str(row[0])
+                if (
+                    stored_e_tag is not None
+                    and e_tag is not None
+                    and e_tag != "*"
+                    and e_tag != stored_e_tag
+                ):
+                    raise ETagConflictError(
+                        "Etag conflict.\nOriginal: %s\r\nCurrent: %s" % (e_tag, stored_e_tag)
+                    )
+
+                new_e_tag = 1 if row is None else row[0] + 1
+                connection.execute(
+                    "INSERT OR REPLACE INTO items (key, e_tag, value) VALUES (?, ?, ?)",
+                    (key, new_e_tag, value),
+                )
+                new_e_tags[key] = str(new_e_tag)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return new_e_tags
+
+    async def delete(self, keys: List[str]):
+        if not keys:
+            return
+        await self._run(self._delete, list(keys))
+
+    def _delete(self, keys: List[str]) -> None:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("DELETE FROM items WHERE key = ?", [(key,) for key in keys])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        Takes the lease of 'key' for 'ttl' seconds, unless another owner holds it
+        and it has not expired. Returns whether 'owner' now holds the lease.
+        """
+        return await self._run(self._acquire_lease, key, owner, ttl)
+
+    def _acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE leases.owner = excluded.owner OR leases.expires < ?",
+            (key, owner, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    async def release_lease(self, key: str, owner: str) -> None:
+        await self._run(self._release_lease, key, owner)
+
+    def _release_lease(self, key: str, owner: str) -> None:
+        self._connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        def _close():
+            if self._connection is not None:
+                # Moves the WAL back into the database file before closing.
+                self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._connection.close()
+                self._connection = None
+
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+    # aiohttp signal handler.
+    async def on_cleanup(self, app) -> None:
+        self.close()
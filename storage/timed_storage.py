@@ -0,0 +1,33 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from typing import Dict, List
+
+from botbuilder.core import Storage, StoreItem
+
+from helpers import TurnMetrics
+
+
+class TimedStorage(Storage):
+    """
+    Records the duration of the reads, writes and deletes of a storage as the
+    stages storage.read, storage.write and storage.delete of the turn metrics.
+    """
+
+    def __init__(self, storage: Storage):
+        if storage is None:
+            raise Exception("[TimedStorage]: Missing parameter. storage is required")
+
+        self.storage = storage
+
+    async def read(self, keys: List[str]) -> Dict[str, StoreItem]:
+        with TurnMetrics.span("storage.read"):
+            return await self.storage.read(keys)
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        with TurnMetrics.span("storage.write"):
+            await self.storage.write(changes)
+
+    async def delete(self, keys: List[str]):
+        with TurnMetrics.span("storage.delete"):
+            await self.storage.delete(keys)